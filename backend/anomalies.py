@@ -2,29 +2,19 @@ from __future__ import annotations
 
 import math
 from dataclasses import dataclass
-from typing import Optional
+from functools import cached_property
 
 
 @dataclass(frozen=True)
 class Stat:
     n: int
     mean: float
-    stdev: float
+    m2: float = 0.0  # сумма квадратов отклонений от среднего
 
+    # Считается один раз на Stat: в выгрузках и карточках к нему обращаются на каждый балл
+    @cached_property
+    def stdev(self) -> float:
+        if self.n < 2:
+            return 0.0
+        return math.sqrt(self.m2 / (self.n - 1))
 
-def compute_stat(values: list[float]) -> Stat:
-    n = len(values)
-    if n == 0:
-        return Stat(n=0, mean=0.0, stdev=0.0)
-    mean = sum(values) / n
-    if n < 2:
-        return Stat(n=n, mean=mean, stdev=0.0)
-    var = sum((x - mean) ** 2 for x in values) / (n - 1)
-    stdev = math.sqrt(var)
-    return Stat(n=n, mean=mean, stdev=stdev)
-
-
-def zscore(value: float, stat: Stat) -> Optional[float]:
-    if stat.n < 2 or stat.stdev <= 0:
-        return None
-    return (value - stat.mean) / stat.stdev
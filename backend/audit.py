@@ -1,13 +1,20 @@
 from __future__ import annotations
 
-import json
 from typing import Any, Optional
 
+import orjson
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
 from .models import AuditLog
 
 
+def _to_json(value: Any) -> str:
+    if value is None:
+        return ""
+    return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
 def write_audit(
     db: Session,
     *,
@@ -26,8 +33,30 @@ def write_audit(
         action=action,
         entity_type=entity_type,
         entity_id=entity_id,
-        before_json=json.dumps(before, ensure_ascii=False, default=str) if before is not None else "",
-        after_json=json.dumps(after, ensure_ascii=False, default=str) if after is not None else "",
+        before_json=_to_json(before),
+        after_json=_to_json(after),
         ip=ip or "",
     )
     db.add(row)
+
+
+def write_audit_bulk(db: Session, rows: list[dict[str, Any]]) -> None:
+    """Несколько записей аудита одним INSERT. Ключи строк — аргументы write_audit (без db)."""
+    if not rows:
+        return
+    db.execute(
+        insert(AuditLog),
+        [
+            {
+                "actor_type": r["actor_type"],
+                "actor_user_id": r.get("actor_user_id"),
+                "action": r["action"],
+                "entity_type": r["entity_type"],
+                "entity_id": r.get("entity_id"),
+                "before_json": _to_json(r.get("before")),
+                "after_json": _to_json(r.get("after")),
+                "ip": r.get("ip") or "",
+            }
+            for r in rows
+        ],
+    )
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from functools import cached_property
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -10,10 +12,19 @@ class Settings(BaseSettings):
     app_port: int = 8000
 
     database_url: str = "sqlite:///./app.db"
+    # Пул соединений (для in-memory SQLite не применяется)
+    db_pool_size: int = 20
+    db_max_overflow: int = 10
+    db_pool_recycle: int = 3600
+    # Потоки для sync-эндпоинтов; должно быть больше DB_POOL_SIZE + DB_MAX_OVERFLOW,
+    # иначе закрытие сессий в get_db ждёт свободный поток, занятый запросом, который ждёт соединение
+    threadpool_size: int = 100
 
     jwt_secret: str
     jwt_alg: str = "HS256"
     jwt_expires_min: int = 1440
+    # Стоимость bcrypt для новых хэшей (у существующих своя, записана в хэше)
+    bcrypt_rounds: int = 12
 
     admin_login: str
     admin_password: str
@@ -23,11 +34,14 @@ class Settings(BaseSettings):
     anomaly_zscore: float = 2.0
     anomaly_min_samples: int = 3
 
-    @property
-    def cors_origin_list(self) -> list[str]:
+    # raiseload("*") на ORM-запросах с явной жадной загрузкой: случайная ленивая загрузка падает сразу (для разработки/тестов)
+    strict_loading: bool = False
+
+    @cached_property
+    def cors_origin_list(self) -> tuple[str, ...]:
         if not self.cors_origins:
-            return []
-        return [o.strip() for o in self.cors_origins.split(",") if o.strip()]
+            return ()
+        return tuple(o.strip() for o in self.cors_origins.split(",") if o.strip())
 
 
 settings = Settings()
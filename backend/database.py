@@ -1,13 +1,43 @@
 from __future__ import annotations
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 
 from .config import settings
 
 
-connect_args = {"check_same_thread": False} if settings.database_url.startswith("sqlite") else {}
-engine = create_engine(settings.database_url, connect_args=connect_args)
+_is_sqlite = settings.database_url.startswith("sqlite")
+
+connect_args = {"check_same_thread": False} if _is_sqlite else {}
+
+# Все запросы идут через Depends(get_db): пул по умолчанию (5 + 10) быстро упирается в лимит под нагрузкой
+engine_kwargs: dict = {}
+if ":memory:" not in settings.database_url and settings.database_url != "sqlite://":
+    engine_kwargs.update(pool_size=settings.db_pool_size, max_overflow=settings.db_max_overflow)
+if not _is_sqlite:
+    # Сетевые БД рвут простаивающие соединения: проверка перед выдачей и периодическое пересоздание
+    engine_kwargs.update(pool_pre_ping=True, pool_recycle=settings.db_pool_recycle)
+
+engine = create_engine(settings.database_url, connect_args=connect_args, **engine_kwargs)
+
+# WAL: читатели не блокируются писателем; synchronous=NORMAL в WAL безопасен и реже делает fsync
+_SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+)
+
+if _is_sqlite:
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_conn, _record) -> None:
+        cursor = dbapi_conn.cursor()
+        try:
+            for pragma in _SQLITE_PRAGMAS:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -1,21 +1,83 @@
 from __future__ import annotations
 
+import hashlib
 import secrets
+import threading
+import time
+from collections import OrderedDict
 from typing import Annotated, Optional
 
 from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBasic, HTTPBasicCredentials, HTTPBearer
+from sqlalchemy import bindparam, select
 from sqlalchemy.orm import Session
 
 from .config import settings
 from .database import get_db
 from .models import User
 from .security import decode_token
+from .services import TargetStats
 
 
 bearer = HTTPBearer(auto_error=False)
 basic = HTTPBasic(auto_error=False)
 
+# Кэш проверенных токенов (LRU): token -> (годен до, payload).
+# Запись живёт не дольше exp самого токена и не дольше _TOKEN_CACHE_TTL секунд;
+# при переполнении вытесняется самый давно использованный токен, а не весь кэш.
+_TOKEN_CACHE_TTL = 60
+_TOKEN_CACHE_MAX = 10_000
+_token_cache: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+_token_lock = threading.Lock()
+
+
+def _decode_token_cached(token: str) -> dict:
+    now = time.time()
+    with _token_lock:
+        hit = _token_cache.get(token)
+        if hit is not None and hit[0] > now:
+            _token_cache.move_to_end(token)
+            return hit[1]
+
+    payload = decode_token(token)
+    expires = min(float(payload.get("exp", now)), now + _TOKEN_CACHE_TTL)
+    with _token_lock:
+        _token_cache[token] = (expires, payload)
+        _token_cache.move_to_end(token)
+        while len(_token_cache) > _TOKEN_CACHE_MAX:
+            _token_cache.popitem(last=False)
+    return payload
+
+
+# nickname -> id: дальше пользователь берётся по первичному ключу через Session.get
+_nick_to_id: dict[str, int] = {}
+_nick_lock = threading.Lock()
+
+
+def forget_nickname(nickname: str) -> None:
+    """Сбрасывает закэшированный id для никнейма (после переименования/удаления)."""
+    with _nick_lock:
+        _nick_to_id.pop(nickname, None)
+
+
+# Собирается один раз; значение передаётся параметром, SQL берётся из кэша компиляции
+_USER_BY_NICKNAME = select(User).where(User.nickname == bindparam("nickname")).limit(1)
+
+
+def _load_user_by_nickname(db: Session, nickname: str) -> Optional[User]:
+    uid = _nick_to_id.get(nickname)
+    if uid is not None:
+        user = db.get(User, uid)
+        if user is not None and user.nickname == nickname:
+            return user
+        forget_nickname(nickname)
+
+    user = db.scalars(_USER_BY_NICKNAME, {"nickname": nickname}).first()
+    if user is not None:
+        with _nick_lock:
+            _nick_to_id[nickname] = user.id
+    return user
+
 
 def get_current_user(
     credentials: Annotated[Optional[HTTPAuthorizationCredentials], Depends(bearer)],
@@ -25,19 +87,32 @@ def get_current_user(
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Требуется авторизация")
 
     try:
-        payload = decode_token(credentials.credentials)
+        payload = _decode_token_cached(credentials.credentials)
         nickname = payload.get("sub")
         if not nickname:
             raise ValueError("missing sub")
     except Exception:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Неверный токен")
 
-    user = db.query(User).filter(User.nickname == nickname).first()
+    user = _load_user_by_nickname(db, nickname)
     if not user or not user.is_active:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Пользователь не найден или отключён")
     return user
 
 
+# Логин/пароль администратора сравниваются по ключевым BLAKE2-дайджестам фиксированной длины,
+# поэтому время сравнения не зависит от длины введённых строк. Ключ случайный на процесс.
+_ADMIN_KEY = secrets.token_bytes(32)
+
+
+def _admin_digest(value: str) -> bytes:
+    return hashlib.blake2b(value.encode("utf-8"), key=_ADMIN_KEY).digest()
+
+
+_ADMIN_LOGIN_DIGEST = _admin_digest(settings.admin_login)
+_ADMIN_PASSWORD_DIGEST = _admin_digest(settings.admin_password)
+
+
 def require_admin(
     request: Request,
     creds: Annotated[Optional[HTTPBasicCredentials], Depends(basic)],
@@ -45,9 +120,14 @@ def require_admin(
     if creds is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Требуется авторизация администратора")
 
-    ok_login = secrets.compare_digest(creds.username, settings.admin_login)
-    ok_pass = secrets.compare_digest(creds.password, settings.admin_password)
+    ok_login = secrets.compare_digest(_admin_digest(creds.username), _ADMIN_LOGIN_DIGEST)
+    ok_pass = secrets.compare_digest(_admin_digest(creds.password), _ADMIN_PASSWORD_DIGEST)
     if not (ok_login and ok_pass):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Неверный логин или пароль администратора")
 
     return request.client.host if request.client else ""
+
+
+def get_target_stats(db: Annotated[Session, Depends(get_db)]) -> TargetStats:
+    """Кэш статистики на время запроса; FastAPI отдаёт один экземпляр всем зависимостям запроса."""
+    return TargetStats(db, include_inactive=True)
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+from .database import engine
+from .models import Base, User
+
+
+def _add_missing_columns() -> None:
+    """Добавляет новые nullable-колонки в существующие таблицы (create_all их не трогает)."""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}'))
+
+
+def _create_missing_indexes() -> None:
+    """create_all не трогает существующие таблицы — добавляем новые индексы отдельно."""
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine)
+
+
+def _backfill() -> None:
+    """Заполняет вычисляемые колонки у строк, созданных до их появления."""
+    with Session(engine) as db:
+        for u in db.query(User).filter(User.full_name_normalized.is_(None)):
+            u.full_name = u.full_name  # validates пересчитает full_name_normalized
+        db.commit()
+
+
+def init_db() -> None:
+    """Создаёт недостающие таблицы, колонки и индексы. Вызывается при старте веб-процесса (lifespan) и вручную."""
+    Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    _create_missing_indexes()
+    _backfill()
+
+
+if __name__ == "__main__":
+    init_db()
+    print("OK: DB schema is up to date")
@@ -1,25 +1,41 @@
 from __future__ import annotations
 
+from contextlib import asynccontextmanager
+
+import anyio.to_thread
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import ORJSONResponse
 
 from .config import settings
-from .database import engine
-from .models import Base
+from .init_db import init_db
 from .routes.admin import router as admin_router
 from .routes.auth import router as auth_router
 from .routes.events import router as events_router, admin_router as events_admin_router
 from .routes.user import router as user_router
+from .static import CachedStaticFiles
+
+
+@asynccontextmanager
+async def _lifespan(_: FastAPI):
+    # Sync-эндпоинты и get_db выполняются в пуле потоков anyio (по умолчанию 40)
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = max(
+        settings.threadpool_size, settings.db_pool_size + settings.db_max_overflow + 10
+    )
+    # Схема и бэкфилл вычисляемых колонок — при старте процесса, а не при импорте приложения
+    await anyio.to_thread.run_sync(init_db)
+    yield
 
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="Платформа оценивания студентов")
+    # orjson для всех JSON-ответов: списки и итоговая таблица сериализуются в разы быстрее stdlib json
+    app = FastAPI(title="Платформа оценивания студентов", default_response_class=ORJSONResponse, lifespan=_lifespan)
 
     if settings.cors_origin_list:
         app.add_middleware(
             CORSMiddleware,
-            allow_origins=settings.cors_origin_list,
+            allow_origins=list(settings.cors_origin_list),
             allow_credentials=True,
             allow_methods=["*"],
             allow_headers=["*"],
@@ -35,11 +51,8 @@ def create_app() -> FastAPI:
     app.include_router(events_router)
     app.include_router(events_admin_router)
 
-    # Tables
-    Base.metadata.create_all(bind=engine)
-
     # Serve frontend as static site (API routes above take precedence)
-    app.mount("/", StaticFiles(directory="frontend", html=True), name="frontend")
+    app.mount("/", CachedStaticFiles(directory="frontend", html=True), name="frontend")
 
     return app
 
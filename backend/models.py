@@ -1,25 +1,29 @@
 from __future__ import annotations
 
 import datetime as dt
-import re
 from typing import Optional
 
-from sqlalchemy import Boolean, DateTime, Float, ForeignKey, Integer, String, Text, UniqueConstraint
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+from sqlalchemy import Boolean, DateTime, Float, ForeignKey, Index, Integer, String, Text, UniqueConstraint
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, validates
 
 
 def normalize_full_name(name: str) -> str:
     """Нормализует ФИО: trim, сжатие пробелов, lowercase для сравнения."""
     if not name:
         return ""
-    return re.sub(r'\s+', ' ', name.strip()).lower()
+    # str.split() без аргументов режет по любым пробельным символам и отбрасывает края
+    return " ".join(name.split()).lower()
 
 
 def normalize_group(group: str) -> str:
     """Нормализует группу: удаление всех пробелов."""
     if not group:
         return ""
-    return re.sub(r'\s+', '', group.strip())
+    return "".join(group.split())
+
+
+def _utcnow() -> dt.datetime:
+    return dt.datetime.utcnow()
 
 
 class Base(DeclarativeBase):
@@ -34,8 +38,8 @@ class Event(Base):
     name: Mapped[str] = mapped_column(String(200), index=True)
     description: Mapped[str] = mapped_column(Text, default="")
     is_active: Mapped[bool] = mapped_column(Boolean, default=True, index=True)
-    created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=lambda: dt.datetime.utcnow())
-    updated_at: Mapped[dt.datetime] = mapped_column(DateTime, default=lambda: dt.datetime.utcnow(), onupdate=lambda: dt.datetime.utcnow())
+    created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=_utcnow)
+    updated_at: Mapped[dt.datetime] = mapped_column(DateTime, default=_utcnow, onupdate=_utcnow)
 
     criteria: Mapped[list["Criterion"]] = relationship(back_populates="event", cascade="all, delete-orphan")
     evaluations: Mapped[list["Evaluation"]] = relationship(back_populates="event", cascade="all, delete-orphan")
@@ -45,12 +49,14 @@ class Event(Base):
 class EventParticipant(Base):
     """Прикрепление пользователя к событию."""
     __tablename__ = "event_participants"
+    # Уникальный индекс (event_id, user_id) покрывает и поиск по паре, и выборки/группировки по event_id,
+    # поэтому отдельного индекса на event_id нет
     __table_args__ = (UniqueConstraint("event_id", "user_id", name="uq_event_user"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    event_id: Mapped[int] = mapped_column(ForeignKey("events.id"), index=True)
+    event_id: Mapped[int] = mapped_column(ForeignKey("events.id"))
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
-    created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=lambda: dt.datetime.utcnow())
+    created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=_utcnow)
 
     event: Mapped["Event"] = relationship(back_populates="participants")
     user: Mapped["User"] = relationship(back_populates="event_participations")
@@ -62,9 +68,12 @@ class User(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     nickname: Mapped[str] = mapped_column(String(64), unique=True, index=True)
     full_name: Mapped[str] = mapped_column(String(200))
+    # Заполняется автоматически при записи full_name (см. _sync_full_name_normalized);
+    # у строк, созданных до появления колонки, — backfill в init_db при старте приложения
+    full_name_normalized: Mapped[Optional[str]] = mapped_column(String(200), nullable=True, index=True)
     group: Mapped[str] = mapped_column(String(64), index=True)
     password_hash: Mapped[str] = mapped_column(String(255))
-    created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=lambda: dt.datetime.utcnow())
+    created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=_utcnow)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
 
     given_evaluations: Mapped[list["Evaluation"]] = relationship(
@@ -77,6 +86,11 @@ class User(Base):
         back_populates="user", cascade="all, delete-orphan"
     )
 
+    @validates("full_name")
+    def _sync_full_name_normalized(self, key: str, value: str) -> str:
+        self.full_name_normalized = normalize_full_name(value)
+        return value
+
 
 class Criterion(Base):
     __tablename__ = "criteria"
@@ -87,8 +101,8 @@ class Criterion(Base):
     description: Mapped[str] = mapped_column(String(500), default="")
     max_score: Mapped[float] = mapped_column(Float, default=10.0)
     active: Mapped[bool] = mapped_column(Boolean, default=True)
-    created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=lambda: dt.datetime.utcnow())
-    updated_at: Mapped[dt.datetime] = mapped_column(DateTime, default=lambda: dt.datetime.utcnow(), onupdate=lambda: dt.datetime.utcnow())
+    created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=_utcnow)
+    updated_at: Mapped[dt.datetime] = mapped_column(DateTime, default=_utcnow, onupdate=_utcnow)
 
     event: Mapped[Optional["Event"]] = relationship(back_populates="criteria")
     scores: Mapped[list["EvaluationScore"]] = relationship(back_populates="criterion")
@@ -96,6 +110,14 @@ class Criterion(Base):
 
 class Evaluation(Base):
     __tablename__ = "evaluations"
+    __table_args__ = (
+        # Поиск существующей оценки (событие, участник, оценщик) при повторном оценивании
+        Index("ix_evaluations_event_target_rater", "event_id", "target_id", "rater_id"),
+        # Админские фильтры/удаление по паре (участник, оценщик) без event_id
+        Index("ix_evaluations_target_rater", "target_id", "rater_id"),
+        # Список оценок в админке сортируется по created_at DESC
+        Index("ix_evaluations_created_at", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     event_id: Mapped[Optional[int]] = mapped_column(ForeignKey("events.id"), nullable=True, index=True)
@@ -105,8 +127,8 @@ class Evaluation(Base):
     target_name: Mapped[Optional[str]] = mapped_column(String(200), nullable=True, index=True)
     target_name_normalized: Mapped[Optional[str]] = mapped_column(String(200), nullable=True, index=True)
     comment: Mapped[str] = mapped_column(Text, default="")
-    created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=lambda: dt.datetime.utcnow())
-    updated_at: Mapped[dt.datetime] = mapped_column(DateTime, default=lambda: dt.datetime.utcnow(), onupdate=lambda: dt.datetime.utcnow())
+    created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=_utcnow)
+    updated_at: Mapped[dt.datetime] = mapped_column(DateTime, default=_utcnow, onupdate=_utcnow)
 
     event: Mapped[Optional["Event"]] = relationship(back_populates="evaluations")
     rater: Mapped[User] = relationship(back_populates="given_evaluations", foreign_keys=[rater_id])
@@ -117,15 +139,24 @@ class Evaluation(Base):
 
 class EvaluationScore(Base):
     __tablename__ = "evaluation_scores"
-    __table_args__ = (UniqueConstraint("evaluation_id", "criterion_id", name="uq_eval_criterion"),)
+    __table_args__ = (
+        UniqueConstraint("evaluation_id", "criterion_id", name="uq_eval_criterion"),
+        # Покрывающий индекс для статистики аномалий: баллы читаются без обращения к таблице
+        Index("ix_evaluation_scores_eval_crit_score", "evaluation_id", "criterion_id", "score"),
+        # Выгрузки сортируются по updated_at DESC, в том числе с фильтром по критерию
+        Index("ix_evaluation_scores_updated_at", "updated_at"),
+        Index("ix_evaluation_scores_crit_updated", "criterion_id", "updated_at"),
+        # Отдельных индексов на evaluation_id и criterion_id нет: их покрывают левые префиксы
+        # uq_eval_criterion / ix_evaluation_scores_eval_crit_score и ix_evaluation_scores_crit_updated
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    evaluation_id: Mapped[int] = mapped_column(ForeignKey("evaluations.id"), index=True)
-    criterion_id: Mapped[int] = mapped_column(ForeignKey("criteria.id"), index=True)
+    evaluation_id: Mapped[int] = mapped_column(ForeignKey("evaluations.id"))
+    criterion_id: Mapped[int] = mapped_column(ForeignKey("criteria.id"))
     score: Mapped[float] = mapped_column(Float)
 
-    created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=lambda: dt.datetime.utcnow())
-    updated_at: Mapped[dt.datetime] = mapped_column(DateTime, default=lambda: dt.datetime.utcnow(), onupdate=lambda: dt.datetime.utcnow())
+    created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=_utcnow)
+    updated_at: Mapped[dt.datetime] = mapped_column(DateTime, default=_utcnow, onupdate=_utcnow)
 
     evaluation: Mapped[Evaluation] = relationship(back_populates="scores")
     criterion: Mapped[Criterion] = relationship(back_populates="scores")
@@ -145,5 +176,5 @@ class AuditLog(Base):
     before_json: Mapped[str] = mapped_column(Text, default="")
     after_json: Mapped[str] = mapped_column(Text, default="")
 
-    created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=lambda: dt.datetime.utcnow())
+    created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=_utcnow, index=True)
     ip: Mapped[str] = mapped_column(String(64), default="")
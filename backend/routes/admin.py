@@ -1,24 +1,26 @@
 from __future__ import annotations
 
-import io
-import csv
 import datetime as dt
+import os
+import tempfile
 import traceback
-from typing import Optional
+from typing import Iterator, Optional
 
 from fastapi import APIRouter, Body, Depends, HTTPException, Query
-from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session, joinedload
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy import Select, delete, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased, joinedload
 
-from ..audit import write_audit
+from ..audit import write_audit, write_audit_bulk
 from ..config import settings
-from ..database import get_db
-from ..deps import require_admin
-from ..models import Criterion, Evaluation, EvaluationScore, User
+from ..database import SessionLocal, get_db
+from ..deps import forget_nickname, get_target_stats, require_admin
+from ..models import AuditLog, Criterion, Evaluation, EvaluationScore, User
 from ..schemas import (
     AdminEvaluationPatch,
     AdminScorePatch,
-    AuditLogRow,
     CriterionCreate,
     CriterionPublic,
     CriterionUpdate,
@@ -26,7 +28,19 @@ from ..schemas import (
     UserAdminUpdate,
 )
 from ..security import hash_password
-from ..services import clamp_score, get_stats_for_target
+from ..services import (
+    TargetStats,
+    anomalous_scores_select,
+    anomaly_bounds,
+    bump_criteria_version,
+    bump_events_version,
+    bump_results_version,
+    clamp_score,
+    iter_csv_chunks,
+    list_criteria_cached,
+    score_anomaly,
+    strict_loading,
+)
 
 
 # We avoid router-level dependencies so we can both protect endpoints and
@@ -34,6 +48,13 @@ from ..services import clamp_score, get_stats_for_target
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
 
+def _page_total(query, items: list, *, limit: int, offset: int) -> int:
+    """Общее число строк для страницы; COUNT(*) не нужен, если страница неполная (это последняя)."""
+    if len(items) < limit and (items or offset == 0):
+        return offset + len(items)
+    return query.count()
+
+
 @router.get("/users", response_model=dict)
 def admin_list_users(
     ip: str = Depends(require_admin),
@@ -42,6 +63,7 @@ def admin_list_users(
     group: Optional[str] = None,
     limit: int = 200,
     offset: int = 0,
+    with_total: bool = True,
 ):
     query = db.query(User)
     if group:
@@ -52,8 +74,8 @@ def admin_list_users(
         like = f"%{q.strip()}%"
         query = query.filter((User.full_name.ilike(like)) | (User.nickname.ilike(like)))
 
-    total = query.count()
     items = query.order_by(User.created_at.desc()).offset(offset).limit(limit).all()
+    total = _page_total(query, items, limit=limit, offset=offset) if with_total else None
     return {
         "total": total,
         "items": [
@@ -70,24 +92,31 @@ def admin_list_users(
     }
 
 
+def _flush_user(db: Session) -> None:
+    """Уникальность никнейма проверяет БД (UNIQUE), а не предварительный SELECT."""
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Никнейм уже занят")
+
+
 @router.post("/users", response_model=dict)
 def admin_create_user(
     payload: UserAdminCreate = Body(...),
     ip: str = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
-    if db.query(User).filter(User.nickname == payload.nickname).first():
-        raise HTTPException(status_code=400, detail="Никнейм уже занят")
-
+    pw_hash = hash_password(payload.password)
     u = User(
-        nickname=payload.nickname.strip(),
-        full_name=payload.full_name.strip(),
-        group=payload.group.replace(" ", "").strip(),
-        password_hash=hash_password(payload.password),
+        nickname=payload.nickname,
+        full_name=payload.full_name,
+        group=payload.group,
+        password_hash=pw_hash,
         is_active=True,
     )
     db.add(u)
-    db.flush()
+    _flush_user(db)
     write_audit(
         db,
         actor_type="admin",
@@ -116,30 +145,31 @@ def admin_update_user(
 
     before = {"nickname": u.nickname, "full_name": u.full_name, "group": u.group, "is_active": u.is_active}
     if payload.nickname is not None:
-        other = db.query(User).filter(User.nickname == payload.nickname, User.id != user_id).first()
-        if other:
-            raise HTTPException(status_code=400, detail="Никнейм уже занят")
-        u.nickname = payload.nickname.strip()
+        forget_nickname(u.nickname)
+        u.nickname = payload.nickname
     if payload.full_name is not None:
-        u.full_name = payload.full_name.strip()
+        u.full_name = payload.full_name
     if payload.group is not None:
-        u.group = payload.group.replace(" ", "").strip()
+        u.group = payload.group
     if payload.is_active is not None:
         u.is_active = bool(payload.is_active)
+    _flush_user(db)
 
     write_audit(db, actor_type="admin", actor_user_id=None, action="update", entity_type="user", entity_id=u.id, before=before, after={"nickname": u.nickname, "full_name": u.full_name, "group": u.group, "is_active": u.is_active}, ip=ip)
     db.add(u)
     db.commit()
+    bump_results_version()
     return {"ok": True}
 
 
 @router.post("/users/{user_id}/reset-password", response_model=dict)
 def admin_reset_password(user_id: int, ip: str = Depends(require_admin), db: Session = Depends(get_db), new_password: str = Query(min_length=6, max_length=128)):
+    pw_hash = hash_password(new_password)
     u = db.query(User).filter(User.id == user_id).first()
     if not u:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     before = {"nickname": u.nickname}
-    u.password_hash = hash_password(new_password)
+    u.password_hash = pw_hash
     write_audit(db, actor_type="admin", actor_user_id=None, action="reset_password", entity_type="user", entity_id=u.id, before=before, after={"nickname": u.nickname}, ip=ip)
     db.add(u)
     db.commit()
@@ -152,9 +182,12 @@ def admin_delete_user(user_id: int, ip: str = Depends(require_admin), db: Sessio
     if not u:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     before = {"nickname": u.nickname}
+    forget_nickname(u.nickname)
     db.delete(u)
     write_audit(db, actor_type="admin", actor_user_id=None, action="delete", entity_type="user", entity_id=user_id, before=before, after=None, ip=ip)
     db.commit()
+    bump_events_version()  # вместе с пользователем уходят его участия в событиях
+    bump_results_version()
     return {"ok": True}
 
 
@@ -166,11 +199,7 @@ def admin_list_criteria(
 ):
     """Получить все критерии. Можно фильтровать по событию."""
     try:
-        q = db.query(Criterion)
-        if event_id:
-            q = q.filter(Criterion.event_id == event_id)
-        items = q.order_by(Criterion.id.asc()).all()
-        return [CriterionPublic(id=c.id, event_id=c.event_id, name=c.name, description=c.description or "", max_score=float(c.max_score), active=bool(c.active)) for c in items]
+        return list_criteria_cached(db, event_id or None)
     except Exception as exc:
         tb = traceback.format_exc()
         print(f"[admin_list_criteria] ERROR:\n{tb}")
@@ -197,7 +226,7 @@ def admin_create_criteria(
             # Проверка уникальности в рамках события
             existing = db.query(Criterion).filter(
                 Criterion.event_id == payload.event_id,
-                Criterion.name == payload.name.strip()
+                Criterion.name == payload.name
             ).first()
             if existing:
                 raise HTTPException(status_code=400, detail="Критерий с таким названием уже существует в этом событии")
@@ -205,15 +234,15 @@ def admin_create_criteria(
             # Глобальный критерий - проверяем глобальную уникальность
             existing = db.query(Criterion).filter(
                 Criterion.event_id.is_(None),
-                Criterion.name == payload.name.strip()
+                Criterion.name == payload.name
             ).first()
             if existing:
                 raise HTTPException(status_code=400, detail="Глобальный критерий с таким названием уже существует")
         
         c = Criterion(
             event_id=payload.event_id,
-            name=payload.name.strip(), 
-            description=(payload.description or "").strip(), 
+            name=payload.name, 
+            description=payload.description or "", 
             max_score=float(payload.max_score), 
             active=bool(payload.active)
         )
@@ -221,6 +250,7 @@ def admin_create_criteria(
         db.flush()
         write_audit(db, actor_type="admin", actor_user_id=None, action="create", entity_type="criterion", entity_id=c.id, after={"event_id": c.event_id, "name": c.name, "max_score": float(c.max_score), "active": bool(c.active)}, ip=ip)
         db.commit()
+        bump_criteria_version()
         return {"id": c.id}
     except HTTPException:
         raise
@@ -247,16 +277,16 @@ def admin_update_criteria(
         if payload.name is not None:
             # Проверяем уникальность в рамках события (или глобально)
             event_id = c.event_id
-            name_q = db.query(Criterion).filter(Criterion.name == payload.name.strip(), Criterion.id != criterion_id)
+            name_q = db.query(Criterion).filter(Criterion.name == payload.name, Criterion.id != criterion_id)
             if event_id:
                 name_q = name_q.filter(Criterion.event_id == event_id)
             else:
                 name_q = name_q.filter(Criterion.event_id.is_(None))
             if name_q.first():
                 raise HTTPException(status_code=400, detail="Название критерия уже существует")
-            c.name = payload.name.strip()
+            c.name = payload.name
         if payload.description is not None:
-            c.description = payload.description.strip()
+            c.description = payload.description
         if payload.max_score is not None:
             c.max_score = float(payload.max_score)
         if payload.active is not None:
@@ -265,6 +295,7 @@ def admin_update_criteria(
         write_audit(db, actor_type="admin", actor_user_id=None, action="update", entity_type="criterion", entity_id=c.id, before=before, after={"name": c.name, "description": c.description, "max_score": float(c.max_score), "active": bool(c.active)}, ip=ip)
         db.add(c)
         db.commit()
+        bump_criteria_version()
         return {"ok": True}
     except HTTPException:
         raise
@@ -276,22 +307,18 @@ def admin_update_criteria(
 
 @router.delete("/criteria/{criterion_id}", response_model=dict)
 def admin_delete_criteria(criterion_id: int, ip: str = Depends(require_admin), db: Session = Depends(get_db)):
-    c = db.query(Criterion).filter(Criterion.id == criterion_id).first()
-    if not c:
-        raise HTTPException(status_code=404, detail="Критерий не найден")
-
     # Hard-delete: remove all scores for this criterion first, then delete the criterion.
     # This enables replacing criteria sets cleanly.
-    deleted_scores = (
-        db.query(EvaluationScore)
-        .filter(EvaluationScore.criterion_id == criterion_id)
-        .delete(synchronize_session=False)
-    )
+    deleted_scores = db.execute(delete(EvaluationScore).where(EvaluationScore.criterion_id == criterion_id)).rowcount
+    row = db.execute(delete(Criterion).where(Criterion.id == criterion_id).returning(Criterion.name)).first()
+    if row is None:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Критерий не найден")
 
-    before = {"name": c.name, "deleted_scores": int(deleted_scores)}
-    db.delete(c)
+    before = {"name": row.name, "deleted_scores": int(deleted_scores)}
     write_audit(db, actor_type="admin", actor_user_id=None, action="delete", entity_type="criterion", entity_id=criterion_id, before=before, after=None, ip=ip)
     db.commit()
+    bump_criteria_version()
     return {"ok": True, "deleted_scores": int(deleted_scores)}
 
 
@@ -307,49 +334,167 @@ def admin_list_evaluations(
     limit: int = 300,
     offset: int = 0,
 ):
-    """Получить все оценки. Фильтрация по event_id, target_id, rater_id."""
-    q = (
-        db.query(Evaluation)
-        .options(
-            joinedload(Evaluation.rater),
-            joinedload(Evaluation.target),
-            joinedload(Evaluation.scores).joinedload(EvaluationScore.criterion),
+    """Получить все оценки. Фильтрация по event_id, target_id, rater_id, criterion_id.
+
+    anomaly_only — только оценки, в которых есть аномальный балл (фильтр в SQL, поэтому limit/offset корректны).
+    """
+    target = aliased(User)
+    rater = aliased(User)
+    stmt = (
+        select(
+            Evaluation.id,
+            Evaluation.target_id,
+            Evaluation.target_name,
+            Evaluation.rater_id,
+            Evaluation.comment,
+            Evaluation.created_at,
+            target.full_name.label("target_full_name"),
+            target.group.label("target_group"),
+            rater.full_name.label("rater_full_name"),
         )
+        .outerjoin(target, target.id == Evaluation.target_id)
+        .outerjoin(rater, rater.id == Evaluation.rater_id)
+    )
+    stmt = _filter_evaluations(stmt, event_id=event_id, target_id=target_id, rater_id=rater_id)
+    if criterion_id is not None:
+        stmt = stmt.where(Evaluation.scores.any(EvaluationScore.criterion_id == criterion_id))
+    if anomaly_only:
+        anomalous = anomalous_scores_select().with_only_columns(EvaluationScore.evaluation_id)
+        if criterion_id is not None:
+            anomalous = anomalous.where(EvaluationScore.criterion_id == criterion_id)
+        stmt = stmt.where(Evaluation.id.in_(anomalous))
+
+    rows = db.execute(stmt.order_by(Evaluation.created_at.desc()).offset(offset).limit(limit)).mappings().all()
+
+    # Баллы страницы одним запросом
+    scores_by_eval: dict[int, list[dict]] = {r["id"]: [] for r in rows}
+    if scores_by_eval:
+        score_rows = db.execute(
+            select(EvaluationScore.evaluation_id, EvaluationScore.criterion_id, Criterion.name, EvaluationScore.score)
+            .join(Criterion, Criterion.id == EvaluationScore.criterion_id)
+            .where(EvaluationScore.evaluation_id.in_(list(scores_by_eval)))
+            .order_by(EvaluationScore.id)
+        )
+        for eval_id, c_id, c_name, score in score_rows:
+            scores_by_eval[eval_id].append({"criterion_id": c_id, "criterion_name": c_name, "score": score})
+
+    return [
+        {
+            "id": r["id"],
+            "target_id": r["target_id"],
+            "target_user_id": r["target_id"],
+            "target_full_name": r["target_full_name"],
+            "target_name": r["target_name"],
+            "target_group": r["target_group"],
+            "rater_id": r["rater_id"],
+            "rater_user_id": r["rater_id"],
+            "rater_full_name": r["rater_full_name"] or "—",
+            "comment": r["comment"] or "",
+            "created_at": r["created_at"],
+            "scores": scores_by_eval[r["id"]],
+        }
+        for r in rows
+    ]
+
+
+# Размер пачки при потоковом чтении строк выгрузки (server-side cursor там, где он есть)
+_EXPORT_BATCH = 1000
+
+
+def _export_scores_select() -> Select:
+    """Плоские строки для выгрузок: один балл на строку, без ORM-объектов."""
+    target = aliased(User)
+    rater = aliased(User)
+    return (
+        select(
+            EvaluationScore.criterion_id,
+            EvaluationScore.score,
+            EvaluationScore.updated_at,
+            Evaluation.target_id,
+            Evaluation.comment,
+            Evaluation.created_at,
+            func.coalesce(target.full_name, Evaluation.target_name).label("target_full_name"),
+            rater.full_name.label("rater_full_name"),
+            Criterion.name.label("criterion_name"),
+            Criterion.max_score,
+        )
+        .join(Evaluation, Evaluation.id == EvaluationScore.evaluation_id)
+        .join(Criterion, Criterion.id == EvaluationScore.criterion_id)
+        .outerjoin(target, target.id == Evaluation.target_id)
+        .outerjoin(rater, rater.id == Evaluation.rater_id)
     )
+
+
+def _filter_evaluations(
+    stmt: Select,
+    *,
+    event_id: Optional[int] = None,
+    target_id: Optional[int] = None,
+    rater_id: Optional[int] = None,
+) -> Select:
     if event_id is not None:
-        q = q.filter(Evaluation.event_id == event_id)
+        stmt = stmt.where(Evaluation.event_id == event_id)
     if target_id is not None:
-        q = q.filter(Evaluation.target_id == target_id)
+        stmt = stmt.where(Evaluation.target_id == target_id)
     if rater_id is not None:
-        q = q.filter(Evaluation.rater_id == rater_id)
+        stmt = stmt.where(Evaluation.rater_id == rater_id)
+    return stmt
+
+
+def _export_rows_select(
+    db: Session,
+    stats: TargetStats,
+    *,
+    event_id: Optional[int],
+    target_id: Optional[int],
+    rater_id: Optional[int],
+    criterion_id: Optional[int],
+) -> Select:
+    """Запрос строк выгрузки с фильтрами; статистика по участникам подгружается заранее одним запросом."""
+    stmt = _filter_evaluations(_export_scores_select(), event_id=event_id, target_id=target_id, rater_id=rater_id)
+    if criterion_id is not None:
+        stmt = stmt.where(EvaluationScore.criterion_id == criterion_id)
+
+    stats.prefetch(db.scalars(stmt.with_only_columns(Evaluation.target_id, maintain_column_froms=True).distinct()))
+    return stmt.order_by(EvaluationScore.updated_at.desc()).execution_options(yield_per=_EXPORT_BATCH)
+
+
+def _iter_export_rows(db: Session, stmt: Select, stats: TargetStats, *, anomaly_only: bool) -> Iterator[tuple]:
+    """Строки выгрузки в порядке колонок _EXPORT_HEADER (Anomaly — bool)."""
+    z_thresh = settings.anomaly_zscore
+    min_n = settings.anomaly_min_samples
+    # Для выгрузки только аномалий: границы по (участник, критерий) считаются один раз,
+    # обычные баллы отсеиваются сравнением до расчёта z
+    bounds: dict[tuple, Optional[tuple[float, float]]] = {}
+    for r in db.execute(stmt).mappings():
+        stat = stats.get(r["target_id"], r["criterion_id"])
+        if anomaly_only:
+            key = (r["target_id"], r["criterion_id"])
+            if key not in bounds:
+                bounds[key] = anomaly_bounds(stat, z_thresh=z_thresh, min_n=min_n)
+            b = bounds[key]
+            if b is None or b[0] < r["score"] < b[1]:
+                continue
+        mean, delta, z, is_anomaly = score_anomaly(r["score"], stat, z_thresh=z_thresh, min_n=min_n)
+        if anomaly_only and not is_anomaly:
+            continue
+        yield (
+            r["target_full_name"],
+            r["rater_full_name"],
+            r["criterion_name"],
+            r["score"],
+            r["max_score"],
+            mean,
+            delta,
+            z,
+            is_anomaly,
+            r["comment"] or "",
+            r["created_at"],
+            r["updated_at"],
+        )
 
-    items = q.order_by(Evaluation.created_at.desc()).offset(offset).limit(limit).all()
 
-    out = []
-    for ev in items:
-        target_name = ev.target.full_name if ev.target else ev.target_name
-        rater_name = ev.rater.full_name if ev.rater else "—"
-        target_group = ev.target.group if ev.target else None
-        
-        out.append({
-            "id": ev.id,
-            "target_id": ev.target_id,
-            "target_user_id": ev.target_id,
-            "target_full_name": ev.target.full_name if ev.target else None,
-            "target_name": ev.target_name,
-            "target_group": target_group,
-            "rater_id": ev.rater_id,
-            "rater_user_id": ev.rater_id,
-            "rater_full_name": rater_name,
-            "comment": ev.comment or "",
-            "created_at": ev.created_at,
-            "scores": [
-                {"criterion_id": s.criterion_id, "criterion_name": s.criterion.name, "score": float(s.score)}
-                for s in ev.scores
-            ]
-        })
-
-    return out
+_EXPORT_HEADER = ("Target", "Rater", "Criterion", "Score", "Max", "Mean", "Delta", "z", "Anomaly", "Comment", "Created", "Updated")
 
 
 @router.get("/evaluations/export/xlsx")
@@ -361,94 +506,39 @@ def admin_export_evaluations_xlsx(
     rater_id: Optional[int] = None,
     criterion_id: Optional[int] = None,
     anomaly_only: bool = False,
+    stats: TargetStats = Depends(get_target_stats),
 ):
-    # Reuse the same query as list but export to Excel
-    q = (
-        db.query(EvaluationScore)
-        .options(
-            joinedload(EvaluationScore.evaluation).joinedload(Evaluation.rater),
-            joinedload(EvaluationScore.evaluation).joinedload(Evaluation.target),
-            joinedload(EvaluationScore.criterion),
-        )
-        .join(Evaluation, Evaluation.id == EvaluationScore.evaluation_id)
-        .join(Criterion, Criterion.id == EvaluationScore.criterion_id)
+    stmt = _export_rows_select(
+        db, stats, event_id=event_id, target_id=target_id, rater_id=rater_id, criterion_id=criterion_id
     )
-    if event_id is not None:
-        q = q.filter(Evaluation.event_id == event_id)
-    if target_id is not None:
-        q = q.filter(Evaluation.target_id == target_id)
-    if rater_id is not None:
-        q = q.filter(Evaluation.rater_id == rater_id)
-    if criterion_id is not None:
-        q = q.filter(EvaluationScore.criterion_id == criterion_id)
-
-    items = q.order_by(EvaluationScore.updated_at.desc()).all()
-
-    stats_cache: dict[int, dict[int, object]] = {}
 
     from openpyxl import Workbook
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Evaluations"
-    ws.append(
-        [
-            "Target",
-            "Rater",
-            "Criterion",
-            "Score",
-            "Max",
-            "Mean",
-            "Delta",
-            "z",
-            "Anomaly",
-            "Comment",
-            "Created",
-            "Updated",
-        ]
-    )
-
-    for s in items:
-        t_id = s.evaluation.target_id
-        if t_id not in stats_cache:
-            stats_cache[t_id] = get_stats_for_target(db, target_id=t_id, include_inactive=True)
-        stat = stats_cache[t_id].get(int(s.criterion_id))
-
-        mean = stat.mean if stat else None  # type: ignore
-        stdev = stat.stdev if stat else None  # type: ignore
-        delta = float(s.score) - mean if mean is not None else None
-        z = delta / stdev if delta is not None and stdev and stdev > 0 else None
-        is_anomaly = bool(z is not None and abs(z) >= settings.anomaly_zscore and stat and getattr(stat, "n", 0) >= settings.anomaly_min_samples)
-
-        if anomaly_only and not is_anomaly:
-            continue
+    # write_only: строки сразу сбрасываются во временный xml, ячейки не копятся в памяти
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Evaluations")
+    ws.append(list(_EXPORT_HEADER))
 
-        ws.append(
-            [
-                s.evaluation.target.full_name,
-                s.evaluation.rater.full_name,
-                s.criterion.name,
-                float(s.score),
-                float(s.criterion.max_score),
-                mean,
-                delta,
-                z,
-                "yes" if is_anomaly else "no",
-                s.evaluation.comment or "",
-                s.evaluation.created_at,
-                s.updated_at,
-            ]
-        )
+    for row in _iter_export_rows(db, stmt, stats, anomaly_only=anomaly_only):
+        row = list(row)
+        row[8] = "yes" if row[8] else "no"
+        ws.append(row)
 
-    bio = io.BytesIO()
-    wb.save(bio)
-    bio.seek(0)
+    # Файл на диске отдаётся через FileResponse (sendfile) и удаляется после отправки
+    with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False) as f:
+        path = f.name
+    try:
+        wb.save(path)
+    except Exception:
+        os.unlink(path)
+        raise
 
     filename = f"evaluations-{dt.datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.xlsx"
-    return StreamingResponse(
-        bio,
+    return FileResponse(
+        path,
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         headers={"Content-Disposition": f"attachment; filename={filename}"},
+        background=BackgroundTask(os.unlink, path),
     )
 
 
@@ -456,83 +546,41 @@ def admin_export_evaluations_xlsx(
 def admin_export_evaluations_csv(
     ip: str = Depends(require_admin),
     db: Session = Depends(get_db),
+    event_id: Optional[int] = None,
     target_id: Optional[int] = None,
     rater_id: Optional[int] = None,
     criterion_id: Optional[int] = None,
     anomaly_only: bool = False,
+    stats: TargetStats = Depends(get_target_stats),
 ):
-    q = (
-        db.query(EvaluationScore)
-        .options(
-            joinedload(EvaluationScore.evaluation).joinedload(Evaluation.rater),
-            joinedload(EvaluationScore.evaluation).joinedload(Evaluation.target),
-            joinedload(EvaluationScore.criterion),
-        )
-        .join(Evaluation, Evaluation.id == EvaluationScore.evaluation_id)
-        .join(Criterion, Criterion.id == EvaluationScore.criterion_id)
+    stmt = _export_rows_select(
+        db, stats, event_id=event_id, target_id=target_id, rater_id=rater_id, criterion_id=criterion_id
     )
-    if target_id is not None:
-        q = q.filter(Evaluation.target_id == target_id)
-    if rater_id is not None:
-        q = q.filter(Evaluation.rater_id == rater_id)
-    if criterion_id is not None:
-        q = q.filter(EvaluationScore.criterion_id == criterion_id)
-
-    items = q.order_by(EvaluationScore.updated_at.desc()).all()
-
-    stats_cache: dict[int, dict[int, object]] = {}
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow([
-        "target",
-        "rater",
-        "criterion",
-        "score",
-        "max",
-        "mean",
-        "delta",
-        "z",
-        "anomaly",
-        "comment",
-        "created",
-        "updated",
-    ])
-
-    for s in items:
-        t_id = s.evaluation.target_id
-        if t_id not in stats_cache:
-            stats_cache[t_id] = get_stats_for_target(db, target_id=t_id, include_inactive=True)
-        stat = stats_cache[t_id].get(int(s.criterion_id))
-
-        mean = stat.mean if stat else None  # type: ignore
-        stdev = stat.stdev if stat else None  # type: ignore
-        delta = float(s.score) - mean if mean is not None else None
-        z = delta / stdev if delta is not None and stdev and stdev > 0 else None
-        is_anomaly = bool(z is not None and abs(z) >= settings.anomaly_zscore and stat and getattr(stat, "n", 0) >= settings.anomaly_min_samples)
 
-        if anomaly_only and not is_anomaly:
-            continue
+    def _rows():
+        # Сессия запроса закрывается до отправки тела ответа, поэтому у генератора своя
+        with SessionLocal() as stream_db:
+            for target, rater, criterion, score, max_score, mean, delta, z, is_anomaly, comment, created, updated in _iter_export_rows(
+                stream_db, stmt, stats, anomaly_only=anomaly_only
+            ):
+                yield (
+                    target,
+                    rater,
+                    criterion,
+                    score,
+                    max_score,
+                    mean if mean is not None else "",
+                    delta if delta is not None else "",
+                    z if z is not None else "",
+                    "yes" if is_anomaly else "no",
+                    comment.replace("\n", " ").strip(),
+                    created.isoformat() if created else "",
+                    updated.isoformat() if updated else "",
+                )
 
-        writer.writerow([
-            s.evaluation.target.full_name,
-            s.evaluation.rater.full_name,
-            s.criterion.name,
-            float(s.score),
-            float(s.criterion.max_score),
-            mean if mean is not None else "",
-            delta if delta is not None else "",
-            z if z is not None else "",
-            "yes" if is_anomaly else "no",
-            (s.evaluation.comment or "").replace("\n", " ").strip(),
-            s.evaluation.created_at.isoformat() if s.evaluation.created_at else "",
-            s.updated_at.isoformat() if s.updated_at else "",
-        ])
-
-    output.seek(0)
     filename = f"evaluations-{dt.datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.csv"
     return StreamingResponse(
-        iter([output.getvalue().encode("utf-8-sig")]),
+        iter_csv_chunks([h.lower() for h in _EXPORT_HEADER], _rows(), batch=_EXPORT_BATCH),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename={filename}"},
     )
@@ -545,27 +593,37 @@ def admin_patch_score(
     ip: str = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
-    s = db.query(EvaluationScore).options(joinedload(EvaluationScore.criterion)).filter(EvaluationScore.id == score_id).first()
+    s = (
+        db.query(EvaluationScore)
+        .options(joinedload(EvaluationScore.criterion), *strict_loading())
+        .filter(EvaluationScore.id == score_id)
+        .first()
+    )
     if not s:
         raise HTTPException(status_code=404, detail="Оценка не найдена")
 
     before = {"score": float(s.score)}
-    s.score = clamp_score(float(payload.score), max_score=float(s.criterion.max_score))
+    s.score = clamp_score(payload.score, max_score=s.criterion.max_score)
     write_audit(db, actor_type="admin", actor_user_id=None, action="update", entity_type="evaluation_score", entity_id=s.id, before=before, after={"score": float(s.score)}, ip=ip)
     db.add(s)
     db.commit()
+    bump_results_version()
     return {"ok": True, "score": float(s.score)}
 
 
 @router.delete("/evaluation-scores/{score_id}", response_model=dict)
 def admin_delete_score(score_id: int, ip: str = Depends(require_admin), db: Session = Depends(get_db)):
-    s = db.query(EvaluationScore).filter(EvaluationScore.id == score_id).first()
-    if not s:
+    row = db.execute(
+        delete(EvaluationScore)
+        .where(EvaluationScore.id == score_id)
+        .returning(EvaluationScore.evaluation_id, EvaluationScore.criterion_id, EvaluationScore.score)
+    ).first()
+    if row is None:
         raise HTTPException(status_code=404, detail="Оценка не найдена")
-    before = {"evaluation_id": s.evaluation_id, "criterion_id": s.criterion_id, "score": float(s.score)}
-    db.delete(s)
+    before = {"evaluation_id": row.evaluation_id, "criterion_id": row.criterion_id, "score": float(row.score)}
     write_audit(db, actor_type="admin", actor_user_id=None, action="delete", entity_type="evaluation_score", entity_id=score_id, before=before, after=None, ip=ip)
     db.commit()
+    bump_results_version()
     return {"ok": True}
 
 
@@ -582,7 +640,7 @@ def admin_patch_evaluation(
 
     before = {"comment": e.comment}
     if payload.comment is not None:
-        e.comment = payload.comment.strip()
+        e.comment = payload.comment
     write_audit(db, actor_type="admin", actor_user_id=None, action="update", entity_type="evaluation", entity_id=e.id, before=before, after={"comment": e.comment}, ip=ip)
     db.add(e)
     db.commit()
@@ -591,24 +649,41 @@ def admin_patch_evaluation(
 
 @router.delete("/evaluations/{evaluation_id}", response_model=dict)
 def admin_delete_evaluation(evaluation_id: int, ip: str = Depends(require_admin), db: Session = Depends(get_db)):
-    e = db.query(Evaluation).filter(Evaluation.id == evaluation_id).first()
-    if not e:
+    # Сначала баллы (каскад ORM при Core-удалении не срабатывает), затем само оценивание
+    db.execute(delete(EvaluationScore).where(EvaluationScore.evaluation_id == evaluation_id))
+    row = db.execute(
+        delete(Evaluation).where(Evaluation.id == evaluation_id).returning(Evaluation.rater_id, Evaluation.target_id)
+    ).first()
+    if row is None:
+        db.rollback()
         raise HTTPException(status_code=404, detail="Оценивание не найдено")
-    before = {"rater_id": e.rater_id, "target_id": e.target_id}
-    db.delete(e)
+    before = {"rater_id": row.rater_id, "target_id": row.target_id}
     write_audit(db, actor_type="admin", actor_user_id=None, action="delete", entity_type="evaluation", entity_id=evaluation_id, before=before, after=None, ip=ip)
     db.commit()
+    bump_results_version()
     return {"ok": True}
 
 
 @router.delete("/evaluations/by-rater/{rater_id}/target/{target_id}", response_model=dict)
 def admin_delete_by_rater(rater_id: int, target_id: int, ip: str = Depends(require_admin), db: Session = Depends(get_db)):
-    q = db.query(Evaluation).filter(Evaluation.rater_id == rater_id, Evaluation.target_id == target_id)
-    count = q.count()
-    q.delete(synchronize_session=False)
-    write_audit(db, actor_type="admin", actor_user_id=None, action="delete_many", entity_type="evaluation", entity_id=None, before={"rater_id": rater_id, "target_id": target_id, "count": count}, after=None, ip=ip)
+    ids = [
+        eid
+        for (eid,) in db.query(Evaluation.id).filter(Evaluation.rater_id == rater_id, Evaluation.target_id == target_id)
+    ]
+    if ids:
+        # Каскад на стороне БД в SQLite не срабатывает — баллы удаляем явно
+        db.query(EvaluationScore).filter(EvaluationScore.evaluation_id.in_(ids)).delete(synchronize_session=False)
+        db.query(Evaluation).filter(Evaluation.id.in_(ids)).delete(synchronize_session=False)
+    write_audit_bulk(db, [{
+        "actor_type": "admin",
+        "action": "delete_many",
+        "entity_type": "evaluation",
+        "before": {"rater_id": rater_id, "target_id": target_id, "count": len(ids), "ids": ids},
+        "ip": ip,
+    }])
     db.commit()
-    return {"ok": True, "deleted": count}
+    bump_results_version()
+    return {"ok": True, "deleted": len(ids)}
 
 
 @router.delete("/evaluations", response_model=dict)
@@ -628,31 +703,40 @@ def admin_delete_all_evaluations(ip: str = Depends(require_admin), db: Session =
         ip=ip,
     )
     db.commit()
+    bump_results_version()
     return {"ok": True, "scores_deleted": int(scores_deleted), "evaluations_deleted": int(evals_deleted)}
 
 
-@router.get("/audit-logs", response_model=dict)
-def admin_audit_logs(ip: str = Depends(require_admin), db: Session = Depends(get_db), limit: int = 300, offset: int = 0):
-    from ..models import AuditLog
+# Колонки строки журнала (поля AuditLogRow)
+_AUDIT_COLUMNS = (
+    AuditLog.id,
+    AuditLog.actor_type,
+    AuditLog.actor_user_id,
+    AuditLog.action,
+    AuditLog.entity_type,
+    AuditLog.entity_id,
+    AuditLog.before_json,
+    AuditLog.after_json,
+    AuditLog.created_at,
+    AuditLog.ip,
+)
 
+
+@router.get("/audit-logs", response_model=dict)
+def admin_audit_logs(
+    ip: str = Depends(require_admin),
+    db: Session = Depends(get_db),
+    limit: int = 300,
+    offset: int = 0,
+    with_total: bool = True,
+):
     q = db.query(AuditLog)
-    total = q.count()
-    items = q.order_by(AuditLog.created_at.desc()).offset(offset).limit(limit).all()
-    return {
-        "total": total,
-        "items": [
-            AuditLogRow(
-                id=a.id,
-                actor_type=a.actor_type,
-                actor_user_id=a.actor_user_id,
-                action=a.action,
-                entity_type=a.entity_type,
-                entity_id=a.entity_id,
-                before_json=a.before_json,
-                after_json=a.after_json,
-                created_at=a.created_at,
-                ip=a.ip,
-            ).model_dump()
-            for a in items
-        ],
-    }
+    rows = db.execute(
+        select(*_AUDIT_COLUMNS)
+        .order_by(AuditLog.created_at.desc())
+        .offset(offset)
+        .limit(limit)
+    ).all()
+    total = _page_total(q, rows, limit=limit, offset=offset) if with_total else None
+    # Строки из БД уже нужных типов: отдаём их сразу в orjson, без валидации моделью
+    return ORJSONResponse({"total": total, "items": [row._asdict() for row in rows]})
@@ -14,15 +14,18 @@ router = APIRouter(prefix="/api/auth", tags=["auth"])
 
 @router.post("/register", response_model=dict)
 def register(payload: RegisterRequest, db: Session = Depends(get_db)):
+    # Хэш считается до обращения к БД, чтобы не держать соединение на время bcrypt
+    pw_hash = hash_password(payload.password)
+
     existing = db.query(User).filter(User.nickname == payload.nickname).first()
     if existing:
         raise HTTPException(status_code=400, detail="Никнейм уже занят")
 
     user = User(
-        nickname=payload.nickname.strip(),
-        full_name=payload.full_name.strip(),
-        group=payload.group.replace(" ", "").strip(),
-        password_hash=hash_password(payload.password),
+        nickname=payload.nickname,
+        full_name=payload.full_name,
+        group=payload.group,
+        password_hash=pw_hash,
         is_active=True,
     )
     db.add(user)
@@ -36,9 +39,12 @@ def login(payload: LoginRequest, db: Session = Depends(get_db)):
     user = db.query(User).filter(User.nickname == payload.nickname).first()
     if not user or not user.is_active:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Неверный логин или пароль")
+    nickname, password_hash = user.nickname, user.password_hash
+    # Соединение возвращается в пул до проверки пароля (bcrypt — самая долгая часть запроса)
+    db.close()
 
-    if not verify_password(payload.password, user.password_hash):
+    if not verify_password(payload.password, password_hash):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Неверный логин или пароль")
 
-    token = create_access_token(subject=user.nickname)
+    token = create_access_token(subject=nickname)
     return TokenResponse(access_token=token)
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
+import datetime as dt
+
 from fastapi import APIRouter, Body, Depends, HTTPException
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+from sqlalchemy import DateTime, bindparam, delete, insert, literal, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
 
 from ..audit import write_audit
 from ..database import get_db
@@ -17,6 +20,14 @@ from ..schemas import (
     EventUpdate,
     EventWithParticipation,
 )
+from ..services import (
+    bump_criteria_version,
+    bump_events_version,
+    events_with_counts_select,
+    list_criteria_cached,
+    list_events_cached,
+    strict_loading,
+)
 
 
 router = APIRouter(prefix="/api/events", tags=["events"])
@@ -24,6 +35,9 @@ router = APIRouter(prefix="/api/events", tags=["events"])
 
 # ==================== Пользовательские эндпоинты ====================
 
+# Собирается один раз; id пользователя передаётся параметром
+_JOINED_EVENT_IDS = select(EventParticipant.event_id).where(EventParticipant.user_id == bindparam("user_id"))
+
 @router.get("", response_model=list[EventWithParticipation])
 def list_events(
     db: Session = Depends(get_db),
@@ -31,38 +45,11 @@ def list_events(
     active_only: bool = True,
 ):
     """Получить список событий с информацией о прикреплении текущего пользователя."""
-    q = db.query(Event)
-    if active_only:
-        q = q.filter(Event.is_active.is_(True))
-    q = q.order_by(Event.created_at.desc())
-    
-    events = q.all()
-    
-    # Получаем ID событий, к которым прикреплён пользователь
-    joined_ids = set(
-        ep.event_id for ep in db.query(EventParticipant)
-        .filter(EventParticipant.user_id == current.id)
-        .all()
-    )
-    
-    # Подсчёт участников для каждого события
-    counts = dict(
-        db.query(EventParticipant.event_id, func.count(EventParticipant.id))
-        .group_by(EventParticipant.event_id)
-        .all()
-    )
-    
+    # Список событий и счётчики общие для всех — из кэша; отдельно только события пользователя
+    joined_ids = set(db.scalars(_JOINED_EVENT_IDS, {"user_id": current.id}))
     return [
-        EventWithParticipation(
-            id=e.id,
-            name=e.name,
-            description=e.description or "",
-            is_active=e.is_active,
-            is_joined=e.id in joined_ids,
-            participants_count=counts.get(e.id, 0),
-            created_at=e.created_at,
-        )
-        for e in events
+        EventWithParticipation(**row, is_joined=row["id"] in joined_ids)
+        for row in list_events_cached(db, active_only=active_only)
     ]
 
 
@@ -93,22 +80,26 @@ def join_event(
     current: User = Depends(get_current_user),
 ):
     """Прикрепиться к событию."""
-    event = db.query(Event).filter(Event.id == event_id).first()
-    if not event:
-        raise HTTPException(status_code=404, detail="Событие не найдено")
-    if not event.is_active:
-        raise HTTPException(status_code=400, detail="Событие неактивно")
-    
-    existing = db.query(EventParticipant).filter(
-        EventParticipant.event_id == event_id,
-        EventParticipant.user_id == current.id
-    ).first()
-    if existing:
+    # Один INSERT ... SELECT: строка вставляется, только если событие есть и активно;
+    # повторное прикрепление отсекает уникальный индекс uq_event_user
+    stmt = insert(EventParticipant).from_select(
+        ["event_id", "user_id", "created_at"],
+        select(Event.id, literal(current.id), literal(dt.datetime.utcnow(), DateTime)).where(
+            Event.id == event_id, Event.is_active.is_(True)
+        ),
+    )
+    try:
+        inserted = db.execute(stmt).rowcount
+        db.commit()
+    except IntegrityError:
+        db.rollback()
         raise HTTPException(status_code=400, detail="Вы уже прикреплены к этому событию")
-    
-    participant = EventParticipant(event_id=event_id, user_id=current.id)
-    db.add(participant)
-    db.commit()
+    if not inserted:
+        is_active = db.scalar(select(Event.is_active).where(Event.id == event_id))
+        if is_active is None:
+            raise HTTPException(status_code=404, detail="Событие не найдено")
+        raise HTTPException(status_code=400, detail="Событие неактивно")
+    bump_events_version()
     
     return {"ok": True, "message": "Вы успешно прикреплены к событию"}
 
@@ -120,19 +111,19 @@ def leave_event(
     current: User = Depends(get_current_user),
 ):
     """Открепиться от события."""
-    event = db.query(Event).filter(Event.id == event_id).first()
-    if not event:
-        raise HTTPException(status_code=404, detail="Событие не найдено")
-    
-    participant = db.query(EventParticipant).filter(
-        EventParticipant.event_id == event_id,
-        EventParticipant.user_id == current.id
-    ).first()
-    if not participant:
-        raise HTTPException(status_code=400, detail="Вы не прикреплены к этому событию")
-    
-    db.delete(participant)
+    deleted = db.execute(
+        delete(EventParticipant).where(
+            EventParticipant.event_id == event_id,
+            EventParticipant.user_id == current.id,
+        )
+    ).rowcount
     db.commit()
+    if not deleted:
+        # Причину уточняем только на пути ошибки
+        if db.scalar(select(Event.id).where(Event.id == event_id)) is None:
+            raise HTTPException(status_code=404, detail="Событие не найдено")
+        raise HTTPException(status_code=400, detail="Вы не прикреплены к этому событию")
+    bump_events_version()
     
     return {"ok": True, "message": "Вы успешно откреплены от события"}
 
@@ -148,9 +139,12 @@ def get_event_participants(
     if not event:
         raise HTTPException(status_code=404, detail="Событие не найдено")
     
-    participants = db.query(EventParticipant).filter(
-        EventParticipant.event_id == event_id
-    ).all()
+    participants = (
+        db.query(EventParticipant)
+        .options(joinedload(EventParticipant.user), *strict_loading())
+        .filter(EventParticipant.event_id == event_id)
+        .all()
+    )
     
     return [
         EventParticipantPublic(
@@ -177,22 +171,10 @@ def get_event_criteria(
     if not event:
         raise HTTPException(status_code=404, detail="Событие не найдено")
     
-    q = db.query(Criterion).filter(Criterion.event_id == event_id)
+    items = list_criteria_cached(db, event_id)
     if active_only:
-        q = q.filter(Criterion.active.is_(True))
-    q = q.order_by(Criterion.id.asc())
-    
-    return [
-        CriterionPublic(
-            id=c.id,
-            event_id=c.event_id,
-            name=c.name,
-            description=c.description or "",
-            max_score=float(c.max_score),
-            active=bool(c.active),
-        )
-        for c in q.all()
-    ]
+        items = [c for c in items if c.active]
+    return items
 
 
 # ==================== Админские эндпоинты ====================
@@ -206,27 +188,8 @@ def admin_list_events(
     db: Session = Depends(get_db),
 ):
     """Админ: получить все события с подсчётом участников."""
-    events = db.query(Event).order_by(Event.created_at.desc()).all()
-    
-    # Подсчёт участников
-    counts = dict(
-        db.query(EventParticipant.event_id, func.count(EventParticipant.id))
-        .group_by(EventParticipant.event_id)
-        .all()
-    )
-    
-    return [
-        {
-            "id": e.id,
-            "name": e.name,
-            "description": e.description or "",
-            "is_active": e.is_active,
-            "participants_count": counts.get(e.id, 0),
-            "created_at": e.created_at,
-            "updated_at": e.updated_at,
-        }
-        for e in events
-    ]
+    stmt = events_with_counts_select(Event.updated_at)
+    return [dict(r) for r in db.execute(stmt).mappings()]
 
 
 @admin_router.post("", response_model=dict)
@@ -237,8 +200,8 @@ def admin_create_event(
 ):
     """Админ: создать событие."""
     event = Event(
-        name=payload.name.strip(),
-        description=(payload.description or "").strip(),
+        name=payload.name,
+        description=payload.description or "",
         is_active=payload.is_active,
     )
     db.add(event)
@@ -255,7 +218,7 @@ def admin_create_event(
         ip=ip,
     )
     db.commit()
-    db.refresh(event)
+    bump_events_version()
     return {"id": event.id}
 
 
@@ -274,9 +237,9 @@ def admin_update_event(
     before = {"name": event.name, "description": event.description, "is_active": event.is_active}
     
     if payload.name is not None:
-        event.name = payload.name.strip()
+        event.name = payload.name
     if payload.description is not None:
-        event.description = payload.description.strip()
+        event.description = payload.description
     if payload.is_active is not None:
         event.is_active = payload.is_active
     
@@ -293,6 +256,7 @@ def admin_update_event(
     )
     db.add(event)
     db.commit()
+    bump_events_version()
     return {"ok": True}
 
 
@@ -321,6 +285,8 @@ def admin_delete_event(
         ip=ip,
     )
     db.commit()
+    bump_events_version()
+    bump_criteria_version()  # критерии события удаляются каскадом
     return {"ok": True}
 
 
@@ -335,9 +301,12 @@ def admin_get_event_participants(
     if not event:
         raise HTTPException(status_code=404, detail="Событие не найдено")
     
-    participants = db.query(EventParticipant).filter(
-        EventParticipant.event_id == event_id
-    ).all()
+    participants = (
+        db.query(EventParticipant)
+        .options(joinedload(EventParticipant.user), *strict_loading())
+        .filter(EventParticipant.event_id == event_id)
+        .all()
+    )
     
     return [
         EventParticipantPublic(
@@ -360,26 +329,28 @@ def admin_remove_participant(
     db: Session = Depends(get_db),
 ):
     """Админ: удалить участника из события."""
-    participant = db.query(EventParticipant).filter(
-        EventParticipant.event_id == event_id,
-        EventParticipant.user_id == user_id
-    ).first()
-    if not participant:
+    participant_id = db.execute(
+        delete(EventParticipant)
+        .where(EventParticipant.event_id == event_id, EventParticipant.user_id == user_id)
+        .returning(EventParticipant.id)
+    ).scalar()
+    if participant_id is None:
+        db.rollback()
         raise HTTPException(status_code=404, detail="Участник не найден")
     
-    db.delete(participant)
     write_audit(
         db,
         actor_type="admin",
         actor_user_id=None,
         action="remove_participant",
         entity_type="event_participant",
-        entity_id=participant.id,
+        entity_id=participant_id,
         before={"event_id": event_id, "user_id": user_id},
         after=None,
         ip=ip,
     )
     db.commit()
+    bump_events_version()
     return {"ok": True}
 
 
@@ -397,8 +368,8 @@ def admin_create_event_criterion(
     
     criterion = Criterion(
         event_id=event_id,
-        name=payload.name.strip(),
-        description=(payload.description or "").strip(),
+        name=payload.name,
+        description=payload.description or "",
         max_score=float(payload.max_score),
         active=bool(payload.active),
     )
@@ -416,4 +387,5 @@ def admin_create_event_criterion(
         ip=ip,
     )
     db.commit()
+    bump_criteria_version()
     return {"id": criterion.id}
@@ -1,31 +1,47 @@
 from __future__ import annotations
 
-import csv
+import datetime as dt
 import io
-from collections import defaultdict
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from itertools import groupby
 from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
 from openpyxl import Workbook
-from sqlalchemy import func, distinct
-from sqlalchemy.orm import Session, joinedload
+from pydantic import TypeAdapter
+from sqlalchemy import and_, bindparam, case, distinct, func, nullsfirst, nullslast, or_, select, update
+from sqlalchemy.orm import Session, aliased
 
 from ..database import get_db
-from ..deps import get_current_user
+from ..deps import forget_nickname, get_current_user
 from ..models import Criterion, Evaluation, EvaluationScore, Event, User, normalize_full_name, normalize_group
 from ..schemas import (
     ChangePasswordRequest,
     CreateEvaluationRequest,
     CriterionPublic,
     EvaluationPublic,
+    EvaluationScorePublic,
     ResultsRow,
     ResultsDetailRow,
     UserPublic,
     UserSelfUpdate,
 )
 from ..security import create_access_token, hash_password, verify_password
-from ..services import clamp_score, evaluation_to_dict, get_stats_for_target
+from ..services import (
+    bump_results_version,
+    get_stats_for_target,
+    iter_csv_chunks,
+    list_criteria_cached,
+    purge_evaluations,
+    results_version,
+    score_anomaly,
+    target_stats_subquery,
+    upsert_scores,
+)
 
 
 router = APIRouter(prefix="/api", tags=["user"])
@@ -39,6 +55,8 @@ def _compute_results(
     group: Optional[str] = None,
     sort: str = "name",
     order: str = "asc",
+    limit: Optional[int] = None,
+    offset: int = 0,
 ) -> list[ResultsRow]:
     """
     Вычисляет итоговую таблицу с агрегацией по нормализованному ФИО.
@@ -50,193 +68,272 @@ def _compute_results(
     from ..config import settings
 
     # Получаем критерии (с фильтром по событию если указано)
-    criteria_q = db.query(Criterion).filter(Criterion.active.is_(True))
-    if event_id:
-        criteria_q = criteria_q.filter(Criterion.event_id == event_id)
-    criteria = criteria_q.order_by(Criterion.id.asc()).all()
-    criteria_by_id = {c.id: c for c in criteria}
+    criteria_by_id = {c.id: c for c in list_criteria_cached(db, event_id or None) if c.active}
 
     if not criteria_by_id:
         return []
 
-    # Базовый запрос для оценок
-    evals_base = db.query(Evaluation).options(
-        joinedload(Evaluation.target),
-        joinedload(Evaluation.scores).joinedload(EvaluationScore.criterion)
+    crit_ids = list(criteria_by_id)
+
+    # 1) Одна строка на оценку: ключ группировки (нормализованное ФИО), данные участника,
+    #    сумма баллов по выбранным критериям и балл по каждому критерию отдельной колонкой
+    key = func.coalesce(User.full_name_normalized, Evaluation.target_name_normalized)
+    per_eval_q = (
+        select(
+            Evaluation.id.label("id"),
+            Evaluation.rater_id.label("rater_id"),
+            key.label("key"),
+            func.coalesce(User.full_name, Evaluation.target_name).label("display_name"),
+            User.id.label("student_id"),
+            func.coalesce(User.group, "").label("group"),
+            func.count(EvaluationScore.id).label("n_scores"),
+            func.coalesce(
+                func.sum(case((EvaluationScore.criterion_id.in_(crit_ids), EvaluationScore.score), else_=0.0)), 0.0
+            ).label("total"),
+            *[
+                func.max(case((EvaluationScore.criterion_id == cid, EvaluationScore.score))).label(f"c_{cid}")
+                for cid in crit_ids
+            ],
+        )
+        .select_from(Evaluation)
+        .outerjoin(User, User.id == Evaluation.target_id)
+        .outerjoin(EvaluationScore, EvaluationScore.evaluation_id == Evaluation.id)
+        .where(or_(User.id.is_not(None), func.coalesce(Evaluation.target_name, "") != ""))
+        .group_by(Evaluation.id, User.id)
     )
     if event_id:
-        evals_base = evals_base.filter(Evaluation.event_id == event_id)
-
-    # Фильтр по группе
+        per_eval_q = per_eval_q.where(Evaluation.event_id == event_id)
     if group:
         group_clean = normalize_group(group)
-        # Для зарегистрированных пользователей
-        user_ids_by_group = [
-            u.id for u in db.query(User).filter(
-                func.replace(User.group, " ", "").ilike(f"%{group_clean}%")
-            ).all()
-        ]
-        evals_base = evals_base.filter(Evaluation.target_id.in_(user_ids_by_group) if user_ids_by_group else False)
-
-    all_evals = evals_base.all()
-
-    # Группируем по нормализованному ФИО
-    # Ключ: normalized_name -> { display_name, student_id, group, evaluations }
-    grouped: dict[str, dict] = defaultdict(lambda: {
-        "display_name": "",
-        "student_id": None,
-        "group": "",
-        "evaluations": [],
-        "raters": set(),
-    })
-
-    for e in all_evals:
-        # Определяем ФИО участника
-        if e.target:
-            full_name = e.target.full_name
-            student_id = e.target.id
-            student_group = e.target.group
-        elif e.target_name:
-            full_name = e.target_name
-            student_id = None
-            student_group = ""
-        else:
-            continue
-
-        normalized = normalize_full_name(full_name)
-        
-        # Фильтр по поиску
-        if q:
-            q_lower = q.strip().lower()
-            if q_lower not in normalized and q_lower not in full_name.lower():
-                continue
-
-        data = grouped[normalized]
-        if not data["display_name"]:
-            data["display_name"] = full_name
-            data["student_id"] = student_id
-            data["group"] = student_group
+        per_eval_q = per_eval_q.where(func.replace(User.group, " ", "").ilike(f"%{group_clean}%"))
+    if q:
+        per_eval_q = per_eval_q.where(key.contains(q.strip().lower(), autoescape=True))
+    per_eval = per_eval_q.cte("per_eval")
+
+    # 2) Агрегат по ФИО: средние по критериям, средний ИТОГО (по оценкам с баллами), число оценщиков.
+    #    Имя, группа и участник берутся из первой (минимальный id) оценки группы
+    grouped = (
+        select(
+            per_eval.c.key,
+            func.min(per_eval.c.id).label("first_id"),
+            func.count(distinct(per_eval.c.rater_id)).label("raters_count"),
+            func.avg(case((per_eval.c.n_scores > 0, per_eval.c.total))).label("overall_mean"),
+            *[func.avg(per_eval.c[f"c_{cid}"]).label(f"c_{cid}") for cid in crit_ids],
+        )
+        .group_by(per_eval.c.key)
+        .cte("grouped")
+    )
+    first = per_eval.alias("first_eval")
+
+    # 3) Аномалии: баллы группы против статистики её зарегистрированного участника
+    #    (|z| >= порога без sqrt: delta^2 * (n - 1) >= z^2 * m2)
+    # Статистика — только по участникам этой таблицы. Считаются баллы по всем активным критериям
+    # (в том числе глобальным при фильтре по событию), а не только по колонкам таблицы
+    stats = target_stats_subquery(
+        target_ids=select(per_eval.c.student_id).where(per_eval.c.student_id.is_not(None)),
+        active_only=True,
+    )
+    delta = EvaluationScore.score - stats.c.mean
+    z_thresh = float(settings.anomaly_zscore)
+    anomalies = (
+        select(per_eval.c.key, func.count(EvaluationScore.id).label("anomaly_count"))
+        .select_from(EvaluationScore)
+        .join(per_eval, per_eval.c.id == EvaluationScore.evaluation_id)
+        .join(grouped, grouped.c.key == per_eval.c.key)
+        .join(first, first.c.id == grouped.c.first_id)
+        .join(stats, and_(stats.c.target_id == first.c.student_id, stats.c.criterion_id == EvaluationScore.criterion_id))
+        .where(
+            stats.c.n >= settings.anomaly_min_samples,
+            stats.c.m2 > 0,
+            delta * delta * (stats.c.n - 1) >= z_thresh * z_thresh * stats.c.m2,
+        )
+        .group_by(per_eval.c.key)
+        .subquery("anomalies")
+    )
 
-        data["evaluations"].append(e)
-        data["raters"].add(e.rater_id)
+    stmt = (
+        select(
+            grouped,
+            first.c.display_name,
+            first.c.student_id,
+            first.c.group,
+            func.coalesce(anomalies.c.anomaly_count, 0).label("anomaly_count"),
+        )
+        .join(first, first.c.id == grouped.c.first_id)
+        .outerjoin(anomalies, anomalies.c.key == grouped.c.key)
+    )
 
-    # Формируем результаты
+    # Сортировка и страница — в SQL; при равенстве порядок первого появления ФИО
+    desc = order.lower() == "desc"
+    if sort == "overall":
+        # Без оценок — в конце при asc и в начале при desc (как прежний reverse-сорт)
+        col = grouped.c.overall_mean
+        sort_by = (nullsfirst(col.desc()) if desc else nullslast(col.asc()),)
+    elif sort == "anomalies":
+        col = func.coalesce(anomalies.c.anomaly_count, 0)
+        sort_by = (col.desc() if desc else col,)
+    elif sort == "raters":
+        sort_by = (grouped.c.raters_count.desc() if desc else grouped.c.raters_count,)
+    else:
+        # Ключ группировки — уже нормализованное ФИО в нижнем регистре (lower() в SQLite не знает кириллицу)
+        sort_by = (grouped.c.key.desc() if desc else grouped.c.key,)
+    stmt = stmt.order_by(*sort_by, grouped.c.first_id)
+    if offset:
+        stmt = stmt.offset(offset)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+
+    # Типы колонок известны (ключ и имя не NULL по условию выборки): model_construct без валидации
     out: list[ResultsRow] = []
-    
-    for normalized, data in grouped.items():
-        evals = data["evaluations"]
-        if not evals:
-            continue
-
-        # Вычисляем средние по критериям и суммарные баллы
-        crit_scores: dict[int, list[float]] = defaultdict(list)
-        total_scores: list[float] = []
-
-        for e in evals:
-            eval_total = 0.0
-            for s in e.scores:
-                if s.criterion_id in criteria_by_id:
-                    crit_scores[s.criterion_id].append(float(s.score))
-                    eval_total += float(s.score)
-            if e.scores:
-                total_scores.append(eval_total)
-
-        # Средние по критериям
+    for r in db.execute(stmt).mappings():
         crit_map: dict[str, Optional[float]] = {}
         for cid, c in criteria_by_id.items():
-            scores = crit_scores.get(cid, [])
-            crit_map[c.name] = (sum(scores) / len(scores)) if scores else None
-
-        # Средний ИТОГО
-        overall_mean = (sum(total_scores) / len(total_scores)) if total_scores else None
-
-        # Подсчёт аномалий
-        anomaly_count = 0
-        if data["student_id"]:
-            stats = get_stats_for_target(db, target_id=data["student_id"])
-            for e in evals:
-                for s in e.scores:
-                    stat = stats.get(int(s.criterion_id))
-                    if not stat or stat.n < settings.anomaly_min_samples or stat.stdev <= 0:
-                        continue
-                    z = (float(s.score) - stat.mean) / stat.stdev
-                    if abs(z) >= settings.anomaly_zscore:
-                        anomaly_count += 1
-
+            value = r[f"c_{cid}"]
+            crit_map[c.name] = float(value) if value is not None else None
         out.append(
-            ResultsRow(
-                normalized_name=normalized,
-                display_name=data["display_name"],
-                student_id=data["student_id"],
-                student_full_name=data["display_name"],
-                group=data["group"],
+            ResultsRow.model_construct(
+                normalized_name=r["key"],
+                display_name=r["display_name"],
+                student_id=r["student_id"],
+                student_full_name=r["display_name"],
+                group=r["group"],
                 criteria=crit_map,
-                overall_mean=overall_mean,
-                raters_count=len(data["raters"]),
-                anomaly_count=anomaly_count,
+                overall_mean=float(r["overall_mean"]) if r["overall_mean"] is not None else None,
+                raters_count=int(r["raters_count"]),
+                anomaly_count=int(r["anomaly_count"]),
             )
         )
 
-    reverse = order.lower() == "desc"
-    if sort == "overall":
-        out.sort(key=lambda r: (r.overall_mean is None, r.overall_mean or 0), reverse=reverse)
-    elif sort == "anomalies":
-        out.sort(key=lambda r: r.anomaly_count, reverse=reverse)
-    elif sort == "raters":
-        out.sort(key=lambda r: r.raters_count, reverse=reverse)
-    else:
-        out.sort(key=lambda r: r.student_full_name.lower(), reverse=reverse)
-
     return out
 
 
+# Кэш итоговой таблицы (LRU): параметры -> (версия данных, годен до, строки).
+# Версия сбрасывает кэш сразу после изменений в этом процессе; TTL ограничивает устаревание
+# при изменениях из других воркеров.
+_RESULTS_TTL = 30.0
+_RESULTS_CACHE_MAX = 256
+_results_cache: OrderedDict[tuple, tuple[int, float, list[ResultsRow]]] = OrderedDict()
+# Одновременные промахи по одному ключу (таблица + обе выгрузки) ждут future первого расчёта,
+# а не дублируют его. Future снимается с регистрации только вместе с публикацией результата в кэш.
+_results_inflight: dict[tuple, Future] = {}
+_results_lock = threading.Lock()
+
+
+def _results_cache_get(key: tuple, version: int) -> Optional[list[ResultsRow]]:
+    # Вызывается под _results_lock
+    hit = _results_cache.get(key)
+    if hit is None or hit[0] != version or hit[1] <= time.monotonic():
+        return None
+    _results_cache.move_to_end(key)
+    return hit[2]
+
+
+def _compute_results_cached(
+    *,
+    db: Session,
+    event_id: Optional[int] = None,
+    q: Optional[str] = None,
+    group: Optional[str] = None,
+    sort: str = "name",
+    order: str = "asc",
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> list[ResultsRow]:
+    # Выгрузки и таблица без фильтров попадают в одну запись
+    key = (event_id, q, group, sort, order, limit, offset)
+    version = results_version()
+    with _results_lock:
+        cached = _results_cache_get(key, version)
+        if cached is not None:
+            return list(cached)
+        fut = _results_inflight.get(key)
+        leader = fut is None
+        if leader:
+            fut = _results_inflight[key] = Future()
+
+    if not leader:
+        # Соединение не держим, пока ждём чужой расчёт
+        db.close()
+        return list(fut.result())
+
+    try:
+        out = _compute_results(
+            db=db, event_id=event_id, q=q, group=group, sort=sort, order=order, limit=limit, offset=offset
+        )
+    except BaseException as exc:
+        with _results_lock:
+            del _results_inflight[key]
+        fut.set_exception(exc)
+        raise
+
+    with _results_lock:
+        _results_cache[key] = (version, time.monotonic() + _RESULTS_TTL, out)
+        _results_cache.move_to_end(key)
+        while len(_results_cache) > _RESULTS_CACHE_MAX:
+            _results_cache.popitem(last=False)
+        del _results_inflight[key]
+    fut.set_result(out)
+    return list(out)
+
+
 def _get_results_detail(
     db: Session,
     normalized_name: str,
     event_id: Optional[int] = None,
 ) -> list[ResultsDetailRow]:
     """Получить детальные оценки для конкретного ФИО."""
-    evals_q = db.query(Evaluation).options(
-        joinedload(Evaluation.rater),
-        joinedload(Evaluation.target),
-        joinedload(Evaluation.scores).joinedload(EvaluationScore.criterion)
+    rater = aliased(User)
+    target = aliased(User)
+    # Плоские строки (оценка × балл) через Core, без ORM-графа; ФИО участника — как в итоговой таблице
+    stmt = (
+        select(
+            Evaluation.id,
+            Evaluation.rater_id,
+            rater.full_name.label("rater_full_name"),
+            Evaluation.comment,
+            Evaluation.created_at,
+            Criterion.name.label("criterion_name"),
+            EvaluationScore.score,
+        )
+        .join(rater, rater.id == Evaluation.rater_id)
+        .outerjoin(target, target.id == Evaluation.target_id)
+        .outerjoin(EvaluationScore, EvaluationScore.evaluation_id == Evaluation.id)
+        .outerjoin(Criterion, Criterion.id == EvaluationScore.criterion_id)
+        .where(
+            # Индексированный отбор кандидатов, затем точное правило: зарегистрированный участник важнее target_name
+            or_(
+                Evaluation.target_id.in_(select(User.id).where(User.full_name_normalized == normalized_name)),
+                Evaluation.target_name_normalized == normalized_name,
+            ),
+            func.coalesce(target.full_name_normalized, Evaluation.target_name_normalized) == normalized_name,
+        )
+        .order_by(Evaluation.created_at.desc(), Evaluation.id.asc(), EvaluationScore.id.asc())
     )
-    
     if event_id:
-        evals_q = evals_q.filter(Evaluation.event_id == event_id)
-    
-    all_evals = evals_q.all()
-    
+        stmt = stmt.where(Evaluation.event_id == event_id)
+
     out: list[ResultsDetailRow] = []
-    for e in all_evals:
-        # Определяем ФИО
-        if e.target:
-            full_name = e.target.full_name
-        elif e.target_name:
-            full_name = e.target_name
-        else:
-            continue
-        
-        if normalize_full_name(full_name) != normalized_name:
-            continue
-        
+    for _, rows in groupby(db.execute(stmt), key=lambda r: r.id):
+        rows = list(rows)
+        first = rows[0]
         scores_dict: dict[str, float] = {}
         total = 0.0
-        for s in e.scores:
-            scores_dict[s.criterion.name] = float(s.score)
-            total += float(s.score)
-        
-        out.append(ResultsDetailRow(
-            evaluation_id=e.id,
-            rater_id=e.rater_id,
-            rater_full_name=e.rater.full_name,
+        for r in rows:
+            if r.criterion_name is None:
+                continue
+            # Float-колонка читается через Core уже как float
+            scores_dict[r.criterion_name] = r.score
+            total += r.score
+
+        out.append(ResultsDetailRow.model_construct(
+            evaluation_id=first.id,
+            rater_id=first.rater_id,
+            rater_full_name=first.rater_full_name,
             scores=scores_dict,
             total_score=total,
-            comment=e.comment or "",
-            created_at=e.created_at,
+            comment=first.comment or "",
+            created_at=first.created_at,
         ))
-    
-    out.sort(key=lambda r: r.created_at, reverse=True)
     return out
 
 
@@ -265,28 +362,21 @@ def change_password(payload: ChangePasswordRequest, db: Session = Depends(get_db
 def update_me(payload: UserSelfUpdate, db: Session = Depends(get_db), current: User = Depends(get_current_user)):
     changed = False
 
+    # Пустые значения отсекает схема (strip + min_length) ещё до обработчика — ответом 422
     if payload.nickname is not None:
-        new_nick = payload.nickname.strip()
-        if not new_nick:
-            raise HTTPException(status_code=400, detail="Никнейм не может быть пустым")
-        other = db.query(User).filter(User.nickname == new_nick, User.id != current.id).first()
+        other = db.query(User).filter(User.nickname == payload.nickname, User.id != current.id).first()
         if other:
             raise HTTPException(status_code=400, detail="Никнейм уже занят")
-        current.nickname = new_nick
+        forget_nickname(current.nickname)
+        current.nickname = payload.nickname
         changed = True
 
     if payload.full_name is not None:
-        new_full = payload.full_name.strip()
-        if not new_full:
-            raise HTTPException(status_code=400, detail="ФИО не может быть пустым")
-        current.full_name = new_full
+        current.full_name = payload.full_name
         changed = True
 
     if payload.group is not None:
-        new_group = payload.group.replace(" ", "").strip()
-        if not new_group:
-            raise HTTPException(status_code=400, detail="Группа не может быть пустой")
-        current.group = new_group
+        current.group = payload.group
         changed = True
 
     if not changed:
@@ -302,6 +392,7 @@ def update_me(payload: UserSelfUpdate, db: Session = Depends(get_db), current: U
 
     db.add(current)
     db.commit()
+    bump_results_version()
     db.refresh(current)
 
     new_token = create_access_token(subject=current.nickname)
@@ -327,23 +418,16 @@ def list_criteria(
     _: User = Depends(get_current_user)
 ):
     """Получить критерии. Можно фильтровать по событию."""
-    q = db.query(Criterion)
+    items = list_criteria_cached(db, event_id or None)
     if active_only:
-        q = q.filter(Criterion.active.is_(True))
-    if event_id:
-        q = q.filter(Criterion.event_id == event_id)
-    q = q.order_by(Criterion.id.asc())
-    return [
-        CriterionPublic(
-            id=c.id,
-            event_id=c.event_id,
-            name=c.name,
-            description=c.description or "",
-            max_score=float(c.max_score),
-            active=bool(c.active),
-        )
-        for c in q.all()
-    ]
+        items = [c for c in items if c.active]
+    return items
+
+
+# Базовый запрос списка студентов собирается один раз; текущий пользователь — параметр
+_ACTIVE_STUDENTS = select(User.id, User.nickname, User.full_name, User.group, User.created_at).where(
+    User.is_active.is_(True), User.id != bindparam("current_id")
+)
 
 
 @router.get("/students", response_model=list[UserPublic])
@@ -353,53 +437,95 @@ def list_students(
     q: Optional[str] = Query(default=None, description="search by nickname/full name"),
     group: Optional[str] = None,
 ):
-    query = db.query(User).filter(User.is_active.is_(True), User.id != current.id)
+    stmt = _ACTIVE_STUDENTS
     if group:
         group_clean = group.replace(" ", "")
-        query = query.filter(func.replace(User.group, " ", "").ilike(f"%{group_clean}%"))
+        stmt = stmt.where(func.replace(User.group, " ", "").ilike(f"%{group_clean}%"))
     if q:
         like = f"%{q.strip()}%"
-        query = query.filter((User.full_name.ilike(like)) | (User.nickname.ilike(like)))
-    query = query.order_by(User.full_name.asc())
-
-    return [
-        UserPublic(
-            id=u.id,
-            nickname=u.nickname,
-            full_name=u.full_name,
-            group=u.group,
-            created_at=u.created_at,
-        )
-        for u in query.all()
-    ]
+        stmt = stmt.where((User.full_name.ilike(like)) | (User.nickname.ilike(like)))
+    stmt = stmt.order_by(User.full_name.asc())
+
+    # Только нужные колонки, без ORM-объектов и identity map
+    return [UserPublic(**r) for r in db.execute(stmt, {"current_id": current.id}).mappings()]
 
 
 @router.get("/students/{target_id}/evaluations", response_model=list[EvaluationPublic])
 def student_evaluations(target_id: int, db: Session = Depends(get_db), current: User = Depends(get_current_user)):
-    target = db.query(User).filter(User.id == target_id, User.is_active.is_(True)).first()
-    if not target:
+    exists = db.scalar(select(User.id).where(User.id == target_id, User.is_active.is_(True)))
+    if exists is None:
         raise HTTPException(status_code=404, detail="Студент не найден")
 
     stats = get_stats_for_target(db, target_id=target_id)
-    # keep only latest evaluation per rater to avoid clutter
-    evals_all = (
-        db.query(Evaluation)
-        .options(joinedload(Evaluation.rater), joinedload(Evaluation.scores).joinedload(EvaluationScore.criterion))
-        .filter(Evaluation.target_id == target_id)
-        .order_by(Evaluation.created_at.desc())
-        .all()
+    # keep only latest evaluation per rater to avoid clutter: отбор делает оконная функция в SQL
+    ranked = (
+        select(
+            Evaluation.id,
+            func.row_number()
+            .over(partition_by=Evaluation.rater_id, order_by=(Evaluation.created_at.desc(), Evaluation.id.desc()))
+            .label("rn"),
+        )
+        .where(Evaluation.target_id == target_id)
+        .subquery()
+    )
+    # Плоские строки (оценка × балл) через Core: без ORM-графа и повторного обхода e.scores
+    stmt = (
+        select(
+            Evaluation.id,
+            Evaluation.rater_id,
+            User.full_name.label("rater_full_name"),
+            Evaluation.comment,
+            Evaluation.created_at,
+            EvaluationScore.id.label("score_id"),
+            EvaluationScore.criterion_id,
+            Criterion.name.label("criterion_name"),
+            Criterion.max_score,
+            EvaluationScore.score,
+        )
+        .join(User, User.id == Evaluation.rater_id)
+        .outerjoin(EvaluationScore, EvaluationScore.evaluation_id == Evaluation.id)
+        .outerjoin(Criterion, Criterion.id == EvaluationScore.criterion_id)
+        .where(Evaluation.id.in_(select(ranked.c.id).where(ranked.c.rn == 1)))
+        .order_by(Evaluation.created_at.desc(), Evaluation.id.desc(), EvaluationScore.id.asc())
     )
 
-    seen_raters: set[int] = set()
-    evals: list[Evaluation] = []
-    for e in evals_all:
-        rid = int(e.rater_id)
-        if rid in seen_raters:
-            continue
-        seen_raters.add(rid)
-        evals.append(e)
+    from ..config import settings
 
-    return [EvaluationPublic(**evaluation_to_dict(e, stats=stats)) for e in evals]
+    z_thresh = settings.anomaly_zscore
+    min_n = settings.anomaly_min_samples
+    out: list[EvaluationPublic] = []
+    # Данные из БД уже типизированы: model_construct без повторной валидации
+    for _, rows in groupby(db.execute(stmt), key=lambda r: r.id):
+        rows = list(rows)
+        first = rows[0]
+        scores: list[EvaluationScorePublic] = []
+        for r in rows:
+            if r.score_id is None:
+                continue
+            stat = stats.get(r.criterion_id)
+            mean, delta, z, is_anomaly = score_anomaly(r.score, stat, z_thresh=z_thresh, min_n=min_n)
+            scores.append(EvaluationScorePublic.model_construct(
+                id=r.score_id,
+                criterion_id=r.criterion_id,
+                criterion_name=r.criterion_name,
+                max_score=r.max_score,
+                score=r.score,
+                mean=mean,
+                stdev=stat.stdev if stat else None,
+                z=z,
+                delta=delta,
+                is_anomaly=is_anomaly,
+            ))
+        out.append(EvaluationPublic.model_construct(
+            id=first.id,
+            rater_id=first.rater_id,
+            rater_full_name=first.rater_full_name,
+            comment=first.comment or "",
+            created_at=first.created_at,
+            scores=scores,
+        ))
+
+    return out
 
 
 @router.post("/students/{target_id}/evaluate", response_model=dict)
@@ -421,10 +547,7 @@ def create_evaluation(target_id: int, payload: CreateEvaluationRequest, db: Sess
             raise HTTPException(status_code=400, detail="Событие неактивно. Нельзя выставлять оценки.")
 
     # Получаем критерии (с фильтром по событию если указано)
-    criteria_q = db.query(Criterion).filter(Criterion.active.is_(True))
-    if event_id:
-        criteria_q = criteria_q.filter(Criterion.event_id == event_id)
-    active_criteria = {c.id: c for c in criteria_q.all()}
+    active_criteria = {c.id: c for c in list_criteria_cached(db, event_id or None) if c.active}
     
     if not active_criteria:
         raise HTTPException(status_code=400, detail="Нет активных критериев")
@@ -440,41 +563,36 @@ def create_evaluation(target_id: int, payload: CreateEvaluationRequest, db: Sess
 
     # If the user already evaluated this target, update their latest evaluation instead of creating a new one.
     # Also delete older duplicates (legacy data).
-    existing_q = db.query(Evaluation).options(joinedload(Evaluation.scores)).filter(
-        Evaluation.rater_id == current.id, 
-        Evaluation.target_id == target_id
-    )
+    existing_q = select(Evaluation.id).where(Evaluation.rater_id == current.id, Evaluation.target_id == target_id)
     if event_id:
-        existing_q = existing_q.filter(Evaluation.event_id == event_id)
-    existing = existing_q.order_by(Evaluation.created_at.desc()).all()
+        existing_q = existing_q.where(Evaluation.event_id == event_id)
+    existing = list(db.scalars(existing_q.order_by(Evaluation.created_at.desc(), Evaluation.id.desc())))
 
-    eval_row: Evaluation
+    updated = bool(existing)
     if existing:
-        eval_row = existing[0]
-        # purge older duplicates
-        for old in existing[1:]:
-            db.delete(old)
-        eval_row.comment = (payload.comment or "").strip()
-        db.add(eval_row)
-        db.flush()
+        eval_id = existing[0]
+        purge_evaluations(db, existing[1:])
+        db.execute(
+            update(Evaluation)
+            .where(Evaluation.id == eval_id)
+            .values(comment=payload.comment or "", updated_at=dt.datetime.utcnow())
+        )
     else:
         eval_row = Evaluation(
             event_id=event_id,
             rater_id=current.id, 
             target_id=target_id, 
-            comment=(payload.comment or "").strip()
+            comment=payload.comment or ""
         )
         db.add(eval_row)
         db.flush()  # get eval_row.id
+        eval_id = eval_row.id
 
-    existing_scores = {int(s.criterion_id): s for s in (eval_row.scores or [])}
-
-    seen: set[int] = set()
+    scores: dict[int, float] = {}
     for item in payload.scores:
         cid = int(item.criterion_id)
-        if cid in seen:
+        if cid in scores:
             continue
-        seen.add(cid)
         crit = active_criteria.get(cid)
         if not crit:
             continue
@@ -485,15 +603,12 @@ def create_evaluation(target_id: int, payload: CreateEvaluationRequest, db: Sess
             val = 0
         if val > max_int:
             val = max_int
+        scores[cid] = float(val)
 
-        if cid in existing_scores:
-            existing_scores[cid].score = float(val)
-            db.add(existing_scores[cid])
-        else:
-            db.add(EvaluationScore(evaluation_id=eval_row.id, criterion_id=cid, score=float(val)))
-
+    upsert_scores(db, eval_id, scores)
     db.commit()
-    return {"id": eval_row.id, "updated": bool(existing)}
+    bump_results_version()
+    return {"id": eval_id, "updated": updated}
 
 
 @router.post("/events/{event_id}/evaluate", response_model=dict)
@@ -516,10 +631,7 @@ def create_event_evaluation(
         raise HTTPException(status_code=400, detail="Событие неактивно. Нельзя выставлять оценки.")
 
     # Получаем критерии события
-    active_criteria = {c.id: c for c in db.query(Criterion).filter(
-        Criterion.event_id == event_id,
-        Criterion.active.is_(True)
-    ).all()}
+    active_criteria = {c.id: c for c in list_criteria_cached(db, event_id) if c.active}
     
     if not active_criteria:
         raise HTTPException(status_code=400, detail="Нет активных критериев для этого события")
@@ -534,7 +646,7 @@ def create_event_evaluation(
             )
 
     # Определяем участника
-    target_name = (payload.target_name or "").strip()
+    target_name = payload.target_name or ""
     target_name_normalized = normalize_full_name(target_name) if target_name else None
 
     if not target_name:
@@ -545,22 +657,31 @@ def create_event_evaluation(
         raise HTTPException(status_code=400, detail="Нельзя оценивать самого себя")
 
     # Ищем существующую оценку для этого участника от этого оценщика в этом событии
-    existing_q = db.query(Evaluation).options(joinedload(Evaluation.scores)).filter(
-        Evaluation.event_id == event_id,
-        Evaluation.rater_id == current.id,
-        Evaluation.target_name_normalized == target_name_normalized
+    existing = list(
+        db.scalars(
+            select(Evaluation.id)
+            .where(
+                Evaluation.event_id == event_id,
+                Evaluation.rater_id == current.id,
+                Evaluation.target_name_normalized == target_name_normalized,
+            )
+            .order_by(Evaluation.created_at.desc(), Evaluation.id.desc())
+        )
     )
-    existing = existing_q.order_by(Evaluation.created_at.desc()).all()
 
-    eval_row: Evaluation
+    updated = bool(existing)
     if existing:
-        eval_row = existing[0]
-        for old in existing[1:]:
-            db.delete(old)
-        eval_row.comment = (payload.comment or "").strip()
-        eval_row.target_name = target_name  # Обновляем на случай изменения регистра
-        db.add(eval_row)
-        db.flush()
+        eval_id = existing[0]
+        purge_evaluations(db, existing[1:])
+        db.execute(
+            update(Evaluation)
+            .where(Evaluation.id == eval_id)
+            .values(
+                comment=payload.comment or "",
+                target_name=target_name,  # Обновляем на случай изменения регистра
+                updated_at=dt.datetime.utcnow(),
+            )
+        )
     else:
         eval_row = Evaluation(
             event_id=event_id,
@@ -568,19 +689,17 @@ def create_event_evaluation(
             target_id=None,  # Внешний участник
             target_name=target_name,
             target_name_normalized=target_name_normalized,
-            comment=(payload.comment or "").strip()
+            comment=payload.comment or ""
         )
         db.add(eval_row)
         db.flush()
+        eval_id = eval_row.id
 
-    existing_scores = {int(s.criterion_id): s for s in (eval_row.scores or [])}
-
-    seen: set[int] = set()
+    scores: dict[int, float] = {}
     for item in payload.scores:
         cid = int(item.criterion_id)
-        if cid in seen:
+        if cid in scores:
             continue
-        seen.add(cid)
         crit = active_criteria.get(cid)
         if not crit:
             continue
@@ -591,15 +710,15 @@ def create_event_evaluation(
             val = 0
         if val > max_int:
             val = max_int
+        scores[cid] = float(val)
 
-        if cid in existing_scores:
-            existing_scores[cid].score = float(val)
-            db.add(existing_scores[cid])
-        else:
-            db.add(EvaluationScore(evaluation_id=eval_row.id, criterion_id=cid, score=float(val)))
-
+    upsert_scores(db, eval_id, scores)
     db.commit()
-    return {"id": eval_row.id, "updated": bool(existing)}
+    bump_results_version()
+    return {"id": eval_id, "updated": updated}
+
+
+_RESULTS_ROWS = TypeAdapter(list[ResultsRow])
 
 
 @router.get("/results", response_model=list[ResultsRow])
@@ -611,6 +730,8 @@ def results(
     group: Optional[str] = None,
     sort: str = "name",
     order: str = "asc",
+    limit: Optional[int] = Query(default=None, ge=1),
+    offset: int = Query(default=0, ge=0),
 ):
     """
     Итоговая таблица с агрегацией по нормализованному ФИО.
@@ -618,8 +739,14 @@ def results(
     Каждая строка — уникальное ФИО:
     - overall_mean: средний ИТОГО (avg по суммарным баллам)
     - raters_count: количество уникальных оценщиков
+
+    limit/offset — страница в порядке сортировки; без limit возвращается вся таблица.
     """
-    return _compute_results(db=db, event_id=event_id, q=q, group=group, sort=sort, order=order)
+    rows = _compute_results_cached(
+        db=db, event_id=event_id, q=q, group=group, sort=sort, order=order, limit=limit, offset=offset
+    )
+    # Строки уже типизированы: сериализуем списком в pydantic-core, минуя обход jsonable_encoder
+    return Response(_RESULTS_ROWS.dump_json(rows), media_type="application/json")
 
 
 @router.get("/results/detail", response_model=list[ResultsDetailRow])
@@ -638,30 +765,24 @@ def results_detail(
 
 @router.get("/results/export/csv")
 def export_csv(db: Session = Depends(get_db), _: User = Depends(get_current_user)):
-    data = _compute_results(db=db)
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-    if not data:
-        writer.writerow(["student", "group", "overall_mean", "anomaly_count"])
-    else:
-        # dynamic criteria headers
-        criteria_headers = list(data[0].criteria.keys())
-        writer.writerow(["student", "group", *criteria_headers, "overall_mean", "anomaly_count"])
-        for row in data:
-            writer.writerow(
-                [
-                    row.student_full_name,
-                    row.group,
-                    *[(row.criteria.get(h) if row.criteria.get(h) is not None else "") for h in criteria_headers],
-                    row.overall_mean if row.overall_mean is not None else "",
-                    row.anomaly_count,
-                ]
-            )
+    data = _compute_results_cached(db=db)
+    criteria_headers = list(data[0].criteria.keys()) if data else []
+
+    rows = (
+        (
+            row.student_full_name,
+            row.group,
+            *[(row.criteria.get(h) if row.criteria.get(h) is not None else "") for h in criteria_headers],
+            row.overall_mean if row.overall_mean is not None else "",
+            row.anomaly_count,
+        )
+        for row in data
+    )
+    header = ["student", "group", *criteria_headers, "overall_mean", "anomaly_count"]
 
-    output.seek(0)
+    # Файл отдаётся кусками; строки форматирует writerows пачками
     return StreamingResponse(
-        iter([output.getvalue().encode("utf-8-sig")]),
+        iter_csv_chunks(header, rows),
         media_type="text/csv",
         headers={"Content-Disposition": "attachment; filename=results.csv"},
     )
@@ -669,11 +790,11 @@ def export_csv(db: Session = Depends(get_db), _: User = Depends(get_current_user
 
 @router.get("/results/export/xlsx")
 def export_xlsx(db: Session = Depends(get_db), _: User = Depends(get_current_user)):
-    data = _compute_results(db=db)
+    data = _compute_results_cached(db=db)
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Results"
+    # write_only: строки сразу сбрасываются в xml, объекты ячеек не копятся в памяти
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Results")
 
     if not data:
         ws.append(["student", "group", "overall_mean", "anomaly_count"])
@@ -1,22 +1,37 @@
 from __future__ import annotations
 
 import datetime as dt
-from typing import Any, Optional
+from typing import Annotated, Any, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field
+
+
+def _strip(value: Any) -> Any:
+    return value.strip() if isinstance(value, str) else value
+
+
+def _strip_group(value: Any) -> Any:
+    return value.replace(" ", "").strip() if isinstance(value, str) else value
+
+
+# Нормализация ввода выполняется один раз при валидации схемы (до проверки длины)
+Stripped = Annotated[str, BeforeValidator(_strip)]
+GroupStr = Annotated[str, BeforeValidator(_strip_group)]
 
 
 # ==================== Events ====================
 
 class EventCreate(BaseModel):
-    name: str = Field(min_length=2, max_length=200)
-    description: str = Field(default="", max_length=2000)
+    name: Stripped = Field(min_length=2, max_length=200)
+    description: Stripped = Field(default="", max_length=2000)
     is_active: bool = True
 
 
 class EventUpdate(BaseModel):
-    name: Optional[str] = Field(default=None, min_length=2, max_length=200)
-    description: Optional[str] = Field(default=None, max_length=2000)
+    model_config = ConfigDict(defer_build=True)
+
+    name: Optional[Stripped] = Field(default=None, min_length=2, max_length=200)
+    description: Optional[Stripped] = Field(default=None, max_length=2000)
     is_active: Optional[bool] = None
 
 
@@ -57,9 +72,9 @@ class TokenResponse(BaseModel):
 
 
 class RegisterRequest(BaseModel):
-    full_name: str = Field(min_length=2, max_length=200)
-    group: str = Field(min_length=1, max_length=64)
-    nickname: str = Field(min_length=3, max_length=64)
+    full_name: Stripped = Field(min_length=2, max_length=200)
+    group: GroupStr = Field(min_length=1, max_length=64)
+    nickname: Stripped = Field(min_length=3, max_length=64)
     password: str = Field(min_length=6, max_length=128)
 
 
@@ -69,12 +84,14 @@ class LoginRequest(BaseModel):
 
 
 class UserSelfUpdate(BaseModel):
-    full_name: Optional[str] = Field(default=None, min_length=2, max_length=200)
-    group: Optional[str] = Field(default=None, min_length=1, max_length=64)
-    nickname: Optional[str] = Field(default=None, min_length=3, max_length=64)
+    full_name: Optional[Stripped] = Field(default=None, min_length=2, max_length=200)
+    group: Optional[GroupStr] = Field(default=None, min_length=1, max_length=64)
+    nickname: Optional[Stripped] = Field(default=None, min_length=3, max_length=64)
 
 
 class UserPublic(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     id: int
     nickname: str
     full_name: str
@@ -83,16 +100,20 @@ class UserPublic(BaseModel):
 
 
 class UserAdminUpdate(BaseModel):
-    nickname: Optional[str] = Field(default=None, min_length=3, max_length=64)
-    full_name: Optional[str] = Field(default=None, min_length=2, max_length=200)
-    group: Optional[str] = Field(default=None, min_length=1, max_length=64)
+    model_config = ConfigDict(defer_build=True)
+
+    nickname: Optional[Stripped] = Field(default=None, min_length=3, max_length=64)
+    full_name: Optional[Stripped] = Field(default=None, min_length=2, max_length=200)
+    group: Optional[GroupStr] = Field(default=None, min_length=1, max_length=64)
     is_active: Optional[bool] = None
 
 
 class UserAdminCreate(BaseModel):
-    nickname: str = Field(min_length=3, max_length=64)
-    full_name: str = Field(min_length=2, max_length=200)
-    group: str = Field(min_length=1, max_length=64)
+    model_config = ConfigDict(defer_build=True)
+
+    nickname: Stripped = Field(min_length=3, max_length=64)
+    full_name: Stripped = Field(min_length=2, max_length=200)
+    group: GroupStr = Field(min_length=1, max_length=64)
     password: str = Field(min_length=6, max_length=128)
 
 
@@ -112,16 +133,18 @@ class CriterionPublic(BaseModel):
 
 class CriterionCreate(BaseModel):
     event_id: Optional[int] = None
-    name: str = Field(min_length=2, max_length=120)
-    description: str = Field(default="", max_length=500)
+    name: Stripped = Field(min_length=2, max_length=120)
+    description: Stripped = Field(default="", max_length=500)
     max_score: float = Field(default=10.0, ge=0)
     active: bool = True
 
 
 class CriterionUpdate(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     event_id: Optional[int] = None
-    name: Optional[str] = Field(default=None, min_length=2, max_length=120)
-    description: Optional[str] = Field(default=None, max_length=500)
+    name: Optional[Stripped] = Field(default=None, min_length=2, max_length=120)
+    description: Optional[Stripped] = Field(default=None, max_length=500)
     max_score: Optional[float] = Field(default=None, ge=0)
     active: Optional[bool] = None
 
@@ -133,12 +156,14 @@ class ScoreInput(BaseModel):
 
 class CreateEvaluationRequest(BaseModel):
     event_id: Optional[int] = None
-    target_name: Optional[str] = Field(default=None, max_length=200)  # Для внешних участников
-    comment: str = Field(default="", max_length=2000)
+    target_name: Optional[Stripped] = Field(default=None, max_length=200)  # Для внешних участников
+    comment: Stripped = Field(default="", max_length=2000)
     scores: list[ScoreInput]
 
 
 class EvaluationScorePublic(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     id: int
     criterion_id: int
     criterion_name: str
@@ -152,6 +177,8 @@ class EvaluationScorePublic(BaseModel):
 
 
 class EvaluationPublic(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     id: int
     rater_id: int
     rater_full_name: str
@@ -162,6 +189,8 @@ class EvaluationPublic(BaseModel):
 
 class ResultsRow(BaseModel):
     """Строка итоговой таблицы — агрегация по нормализованному ФИО."""
+    model_config = ConfigDict(frozen=True)
+
     normalized_name: str  # Ключ группировки
     display_name: str  # Отображаемое ФИО
     student_id: Optional[int] = None  # ID пользователя (если это зарег. пользователь)
@@ -185,14 +214,20 @@ class ResultsDetailRow(BaseModel):
 
 
 class AdminScorePatch(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     score: int
 
 
 class AdminEvaluationPatch(BaseModel):
-    comment: Optional[str] = Field(default=None, max_length=2000)
+    model_config = ConfigDict(defer_build=True)
+
+    comment: Optional[Stripped] = Field(default=None, max_length=2000)
 
 
 class AuditLogRow(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     id: int
     actor_type: str
     actor_user_id: Optional[int]
@@ -1,35 +1,45 @@
 from __future__ import annotations
 
-import datetime as dt
+import time
 from typing import Optional
 
-from jose import jwt
-from passlib.context import CryptContext
+import bcrypt
+import jwt
 
 from .config import settings
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Ключ и алгоритм подготавливаются один раз, а не на каждый выпуск/проверку токена
+_JWT_KEY = settings.jwt_secret.encode("utf-8")
+_JWT_ALG = settings.jwt_alg
+_JWT_ALGORITHMS = [_JWT_ALG]
+
+# bcrypt учитывает только первые 72 байта пароля (passlib обрезал так же, новые версии bcrypt падают)
+_BCRYPT_MAX_BYTES = 72
+
+
+def _password_bytes(password: str) -> bytes:
+    return password.encode("utf-8")[:_BCRYPT_MAX_BYTES]
 
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return bcrypt.hashpw(_password_bytes(password), bcrypt.gensalt(rounds=settings.bcrypt_rounds)).decode("ascii")
 
 
 def verify_password(password: str, password_hash: str) -> bool:
-    return pwd_context.verify(password, password_hash)
+    # Хэши, записанные через passlib ($2a$/$2b$/$2y$), проверяются напрямую
+    try:
+        return bcrypt.checkpw(_password_bytes(password), password_hash.encode("ascii"))
+    except (ValueError, UnicodeEncodeError):
+        return False
 
 
 def create_access_token(*, subject: str, minutes: Optional[int] = None) -> str:
     expires_minutes = minutes if minutes is not None else settings.jwt_expires_min
-    now = dt.datetime.utcnow()
-    payload = {
-        "sub": subject,
-        "iat": int(now.timestamp()),
-        "exp": int((now + dt.timedelta(minutes=expires_minutes)).timestamp()),
-    }
-    return jwt.encode(payload, settings.jwt_secret, algorithm=settings.jwt_alg)
+    now = int(time.time())
+    payload = {"sub": subject, "iat": now, "exp": now + expires_minutes * 60}
+    return jwt.encode(payload, _JWT_KEY, algorithm=_JWT_ALG)
 
 
 def decode_token(token: str) -> dict:
-    return jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_alg])
+    return jwt.decode(token, _JWT_KEY, algorithms=_JWT_ALGORITHMS)
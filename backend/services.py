@@ -1,78 +1,375 @@
 from __future__ import annotations
 
-from collections import defaultdict
-from typing import Optional
+import csv
+import datetime as dt
+import io
+import time
+from itertools import islice
+from typing import Iterable, Iterator, Optional, Sequence
 
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import Select, and_, bindparam, delete, func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, joinedload, raiseload, selectinload
 
-from .anomalies import Stat, compute_stat, zscore
+from .anomalies import Stat
 from .config import settings
-from .models import Criterion, Evaluation, EvaluationScore
+from .models import Criterion, Evaluation, EvaluationScore, Event, EventParticipant
+from .schemas import CriterionPublic
+
+
+def strict_loading() -> tuple:
+    """Опции запроса, запрещающие незапланированные ленивые загрузки (при settings.strict_loading)."""
+    return (raiseload("*"),) if settings.strict_loading else ()
+
+
+# Версия данных итоговой таблицы (/api/results и выгрузки) в этом процессе:
+# растёт при изменении оценок, критериев, ФИО и групп участников.
+_results_version = 0
+
+
+def bump_results_version() -> None:
+    """Сбрасывает кэш итоговой таблицы; вызывать после изменений, влияющих на результаты."""
+    global _results_version
+    _results_version += 1
+
+
+def results_version() -> int:
+    return _results_version
+
+
+# Кэш списков критериев: event_id -> (отметка, список).
+# Отметка — (COUNT, MAX(updated_at)) по таблице criteria: один дешёвый агрегат на запрос
+# замечает изменения критериев, в том числе сделанные другими воркерами.
+_criteria_cache: dict[Optional[int], tuple[tuple, list[CriterionPublic]]] = {}
+
+
+def bump_criteria_version() -> None:
+    """Сбрасывает кэш критериев; вызывать после создания/изменения/удаления критериев."""
+    _criteria_cache.clear()
+    bump_results_version()  # состав критериев меняет и итоговую таблицу
+
+
+# Запросы собираются один раз при импорте; фильтры передаются параметрами
+_CRITERIA_STAMP = select(func.count(Criterion.id), func.max(Criterion.updated_at))
+_CRITERIA_ALL = select(
+    Criterion.id, Criterion.event_id, Criterion.name, Criterion.description, Criterion.max_score, Criterion.active
+).order_by(Criterion.id.asc())
+_CRITERIA_BY_EVENT = _CRITERIA_ALL.where(Criterion.event_id == bindparam("event_id"))
+
+
+def _criteria_stamp(db: Session) -> tuple:
+    return tuple(db.execute(_CRITERIA_STAMP).one())
+
+
+def list_criteria_cached(db: Session, event_id: Optional[int] = None) -> list[CriterionPublic]:
+    stamp = _criteria_stamp(db)
+    hit = _criteria_cache.get(event_id)
+    if hit is not None and hit[0] == stamp:
+        return list(hit[1])
+
+    if event_id:
+        rows = db.execute(_CRITERIA_BY_EVENT, {"event_id": event_id})
+    else:
+        rows = db.execute(_CRITERIA_ALL)
+    items = [
+        CriterionPublic(
+            id=r.id,
+            event_id=r.event_id,
+            name=r.name,
+            description=r.description or "",
+            max_score=float(r.max_score),
+            active=bool(r.active),
+        )
+        for r in rows
+    ]
+    _criteria_cache[event_id] = (stamp, items)
+    return list(items)
+
+
+# Кэш списка событий с числом участников: active_only -> (версия, годен до, строки).
+# Сбрасывается при изменении событий и состава участников.
+_EVENTS_TTL = 30.0
+_events_version = 0
+_events_cache: dict[bool, tuple[int, float, list[dict]]] = {}
+
+
+def bump_events_version() -> None:
+    """Сбрасывает кэш событий; вызывать после изменения событий или их участников."""
+    global _events_version
+    _events_version += 1
+
+
+def events_with_counts_select(*extra_columns) -> Select:
+    """События (новые первыми) с participants_count: один LEFT JOIN + GROUP BY по событию."""
+    return (
+        select(
+            Event.id,
+            Event.name,
+            func.coalesce(Event.description, "").label("description"),
+            Event.is_active,
+            func.count(EventParticipant.id).label("participants_count"),
+            Event.created_at,
+            *extra_columns,
+        )
+        .outerjoin(EventParticipant, EventParticipant.event_id == Event.id)
+        .group_by(Event.id)
+        .order_by(Event.created_at.desc())
+    )
+
+
+def list_events_cached(db: Session, *, active_only: bool = True) -> list[dict]:
+    """События (новые первыми) с participants_count; без признака участия текущего пользователя."""
+    now = time.monotonic()
+    hit = _events_cache.get(active_only)
+    if hit is not None and hit[0] == _events_version and hit[1] > now:
+        return hit[2]
+
+    version = _events_version
+    stmt = events_with_counts_select()
+    if active_only:
+        stmt = stmt.where(Event.is_active.is_(True))
+    rows = [dict(r) for r in db.execute(stmt).mappings()]
+    _events_cache[active_only] = (version, now + _EVENTS_TTL, rows)
+    return rows
 
 
 def clamp_score(value: float, *, max_score: float) -> float:
-    if value < 0:
-        return 0.0
-    if value > max_score:
-        return float(max_score)
-    return float(value)
+    return 0.0 if value < 0 else (float(max_score) if value > max_score else float(value))
+
+
+# Диалекты с INSERT ... ON CONFLICT DO UPDATE
+_UPSERT_INSERT = {"sqlite": sqlite_insert, "postgresql": pg_insert}
+
+
+def upsert_scores(db: Session, evaluation_id: int, scores: dict[int, float]) -> None:
+    """Записывает баллы оценки (criterion_id -> score) одним INSERT ... ON CONFLICT DO UPDATE по uq_eval_criterion."""
+    if not scores:
+        return
+    now = dt.datetime.utcnow()
+    rows = [
+        {"evaluation_id": evaluation_id, "criterion_id": cid, "score": score, "created_at": now, "updated_at": now}
+        for cid, score in scores.items()
+    ]
+
+    dialect_insert = _UPSERT_INSERT.get(db.get_bind().dialect.name)
+    if dialect_insert is not None:
+        stmt = dialect_insert(EvaluationScore).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[EvaluationScore.evaluation_id, EvaluationScore.criterion_id],
+            set_={"score": stmt.excluded.score, "updated_at": stmt.excluded.updated_at},
+        )
+        db.execute(stmt)
+        return
+
+    # Прочие БД: пакетный UPDATE существующих и один многострочный INSERT новых
+    existing = set(
+        db.scalars(select(EvaluationScore.criterion_id).where(EvaluationScore.evaluation_id == evaluation_id))
+    )
+    to_update = [r for r in rows if r["criterion_id"] in existing]
+    to_insert = [r for r in rows if r["criterion_id"] not in existing]
+    if to_update:
+        db.execute(
+            update(EvaluationScore.__table__)
+            .where(
+                EvaluationScore.__table__.c.evaluation_id == bindparam("b_evaluation_id"),
+                EvaluationScore.__table__.c.criterion_id == bindparam("b_criterion_id"),
+            )
+            .values(score=bindparam("b_score"), updated_at=bindparam("b_updated_at")),
+            [
+                {"b_evaluation_id": evaluation_id, "b_criterion_id": r["criterion_id"], "b_score": r["score"], "b_updated_at": now}
+                for r in to_update
+            ],
+        )
+    if to_insert:
+        db.execute(insert(EvaluationScore), to_insert)
+
+
+def purge_evaluations(db: Session, evaluation_ids: list[int]) -> None:
+    """Удаляет оценки вместе с баллами двумя DELETE (без загрузки ORM-объектов и каскада в Python)."""
+    if not evaluation_ids:
+        return
+    db.execute(delete(EvaluationScore).where(EvaluationScore.evaluation_id.in_(evaluation_ids)))
+    db.execute(delete(Evaluation).where(Evaluation.id.in_(evaluation_ids)))
 
 
 def get_stats_for_target(db: Session, *, target_id: int, include_inactive: bool = False) -> dict[int, Stat]:
-    q = (
-        db.query(EvaluationScore.criterion_id, EvaluationScore.score)
+    return get_stats_for_targets(db, [target_id], include_inactive=include_inactive).get(int(target_id), {})
+
+
+def get_stats_for_targets(
+    db: Session, target_ids: Iterable[Optional[int]], *, include_inactive: bool = False
+) -> dict[int, dict[int, Stat]]:
+    """Статистика по критериям сразу для нескольких участников: target_id -> criterion_id -> Stat."""
+    ids = {int(t) for t in target_ids if t is not None}
+    if not ids:
+        return {}
+
+    # Тот же подзапрос, что у фильтров аномалий в SQL: z в карточке и в выгрузках совпадают до бита
+    stats = target_stats_subquery(target_ids=list(ids), active_only=not include_inactive)
+    out: dict[int, dict[int, Stat]] = {}
+    for t_id, c_id, n, mean, m2 in db.execute(select(stats)):
+        out.setdefault(int(t_id), {})[int(c_id)] = Stat(n=int(n), mean=float(mean), m2=float(m2))
+    return out
+
+
+class TargetStats:
+    """Статистика по участникам в пределах одного запроса: загружается пачками и переиспользуется."""
+
+    def __init__(self, db: Session, *, include_inactive: bool = True) -> None:
+        self._db = db
+        self._include_inactive = include_inactive
+        self._cache: dict[int, dict[int, Stat]] = {}
+
+    def prefetch(self, target_ids: Iterable[Optional[int]]) -> None:
+        missing = {int(t) for t in target_ids if t is not None and t not in self._cache}
+        if not missing:
+            return
+        self._cache.update(get_stats_for_targets(self._db, missing, include_inactive=self._include_inactive))
+        for t_id in missing:
+            self._cache.setdefault(t_id, {})
+
+    def get(self, target_id: Optional[int], criterion_id: int) -> Optional[Stat]:
+        if target_id is None:
+            return None
+        if target_id not in self._cache:
+            self.prefetch([target_id])
+        return self._cache[target_id].get(int(criterion_id))
+
+
+def score_anomaly(
+    score: float,
+    stat: Optional[Stat],
+    *,
+    z_thresh: Optional[float] = None,
+    min_n: Optional[int] = None,
+) -> tuple[Optional[float], Optional[float], Optional[float], bool]:
+    """(mean, delta, z, is_anomaly) для одного балла.
+
+    В циклах пороги лучше передавать явно, чтобы не читать settings на каждой строке.
+    """
+    if stat is None:
+        return None, None, None, False
+    if z_thresh is None:
+        z_thresh = settings.anomaly_zscore
+    if min_n is None:
+        min_n = settings.anomaly_min_samples
+    mean = stat.mean
+    delta = score - mean
+    stdev = stat.stdev
+    z = delta / stdev if stdev > 0 else None
+    return mean, delta, z, z is not None and stat.n >= min_n and abs(z) >= z_thresh
+
+
+def anomaly_bounds(stat: Optional[Stat], *, z_thresh: float, min_n: int) -> Optional[tuple[float, float]]:
+    """Интервал (lo, hi), строго внутри которого балл заведомо не аномален; None — аномалий быть не может.
+
+    Для фильтров по аномалиям: отсев большинства баллов двумя сравнениями без деления.
+    Интервал чуть сужен, чтобы граничные баллы проверялись точно через score_anomaly.
+    """
+    if stat is None or stat.n < min_n:
+        return None
+    stdev = stat.stdev
+    if stdev <= 0:
+        return None
+    margin = z_thresh * stdev * (1 - 1e-9)
+    return stat.mean - margin, stat.mean + margin
+
+
+def target_stats_subquery(*, target_ids=None, criterion_ids=None, active_only: bool = False):
+    """Подзапрос (target_id, criterion_id, n, mean, m2) по оценкам зарегистрированных участников.
+
+    target_ids (список или подзапрос) и criterion_ids сужают агрегацию до нужных участников/критериев,
+    active_only — только активные критерии.
+    m2 считается вторым проходом как SUM((x - mean)^2) от сгруппированного среднего:
+    формула SUM(x^2) - SUM(x)^2/n теряет точность на вычитании близких чисел.
+    """
+    means = (
+        select(
+            Evaluation.target_id.label("target_id"),
+            EvaluationScore.criterion_id.label("criterion_id"),
+            func.count(EvaluationScore.id).label("n"),
+            func.avg(EvaluationScore.score).label("mean"),
+        )
         .join(Evaluation, Evaluation.id == EvaluationScore.evaluation_id)
-        .join(Criterion, Criterion.id == EvaluationScore.criterion_id)
-        .filter(Evaluation.target_id == target_id)
+        .where(Evaluation.target_id.is_not(None))
+        .group_by(Evaluation.target_id, EvaluationScore.criterion_id)
     )
-    if not include_inactive:
-        q = q.filter(Criterion.active.is_(True))
-
-    buckets: dict[int, list[float]] = defaultdict(list)
-    for criterion_id, score in q.all():
-        buckets[int(criterion_id)].append(float(score))
-
-    return {cid: compute_stat(values) for cid, values in buckets.items()}
-
-
-def evaluation_to_dict(e: Evaluation, *, stats: dict[int, Stat]) -> dict:
-    z_thresh = settings.anomaly_zscore
-    min_n = settings.anomaly_min_samples
-
-    out_scores: list[dict] = []
-    for s in e.scores:
-        stat = stats.get(int(s.criterion_id))
-        z = zscore(float(s.score), stat) if stat else None
-        is_anomaly = bool(stat and stat.n >= min_n and z is not None and abs(z) >= z_thresh)
-        out_scores.append(
-            {
-                "id": int(s.id),
-                "criterion_id": int(s.criterion_id),
-                "criterion_name": s.criterion.name,
-                "max_score": float(s.criterion.max_score),
-                "score": float(s.score),
-                "mean": float(stat.mean) if stat else None,
-                "stdev": float(stat.stdev) if stat else None,
-                "z": float(z) if z is not None else None,
-                "delta": float(s.score - stat.mean) if stat else None,
-                "is_anomaly": is_anomaly,
-            }
+    if target_ids is not None:
+        means = means.where(Evaluation.target_id.in_(target_ids))
+    if criterion_ids is not None:
+        means = means.where(EvaluationScore.criterion_id.in_(criterion_ids))
+    if active_only:
+        means = means.join(Criterion, Criterion.id == EvaluationScore.criterion_id).where(Criterion.active.is_(True))
+    means = means.subquery("target_means")
+
+    # Второй проход по тем же баллам: фильтры уже применены через JOIN со средними
+    dev = EvaluationScore.score - means.c.mean
+    return (
+        select(means.c.target_id, means.c.criterion_id, means.c.n, means.c.mean, func.sum(dev * dev).label("m2"))
+        .select_from(EvaluationScore)
+        .join(Evaluation, Evaluation.id == EvaluationScore.evaluation_id)
+        .join(
+            means,
+            and_(means.c.target_id == Evaluation.target_id, means.c.criterion_id == EvaluationScore.criterion_id),
         )
+        .group_by(means.c.target_id, means.c.criterion_id, means.c.n, means.c.mean)
+        .subquery("target_stats")
+    )
 
-    return {
-        "id": int(e.id),
-        "rater_id": int(e.rater_id),
-        "rater_full_name": e.rater.full_name,
-        "comment": e.comment or "",
-        "created_at": e.created_at,
-        "scores": out_scores,
-    }
+
+def anomalous_scores_select() -> Select:
+    """SELECT аномальных баллов: |z| >= порога при n >= min_n.
+
+    Условие записано без sqrt (в SQLite его нет): (x - mean)^2 * (n - 1) >= z^2 * m2.
+    """
+    z_thresh = float(settings.anomaly_zscore)
+    stats = target_stats_subquery()
+    delta = EvaluationScore.score - stats.c.mean
+    return (
+        select(EvaluationScore.id, EvaluationScore.evaluation_id, EvaluationScore.criterion_id)
+        .join(Evaluation, Evaluation.id == EvaluationScore.evaluation_id)
+        .join(stats, and_(stats.c.target_id == Evaluation.target_id, stats.c.criterion_id == EvaluationScore.criterion_id))
+        .where(
+            stats.c.n >= settings.anomaly_min_samples,
+            stats.c.m2 > 0,
+            delta * delta * (stats.c.n - 1) >= z_thresh * z_thresh * stats.c.m2,
+        )
+    )
 
 
 def load_evaluation(db: Session, evaluation_id: int) -> Optional[Evaluation]:
+    # Коллекцию баллов — отдельным IN-запросом: JOIN размножал бы строку оценки на каждый балл
     return (
         db.query(Evaluation)
-        .options(joinedload(Evaluation.rater), joinedload(Evaluation.scores).joinedload(EvaluationScore.criterion))
+        .options(
+            joinedload(Evaluation.rater),
+            selectinload(Evaluation.scores).joinedload(EvaluationScore.criterion),
+            *strict_loading(),
+        )
         .filter(Evaluation.id == evaluation_id)
         .first()
     )
+
+
+def iter_csv_chunks(header: Sequence, rows: Iterable[Sequence], *, batch: int = 500) -> Iterator[bytes]:
+    """CSV (UTF-8 с BOM) кусками по batch строк: writerows гоняет цикл форматирования внутри C-модуля csv,
+    а в памяти держится только текущий кусок."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    def _flush() -> bytes:
+        chunk = buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate(0)
+        return chunk
+
+    writer.writerow(header)
+    yield "\ufeff".encode("utf-8") + _flush()
+    rows = iter(rows)
+    while True:
+        writer.writerows(islice(rows, batch))
+        chunk = _flush()
+        if not chunk:
+            return
+        yield chunk
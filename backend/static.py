@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import os
+from typing import Union
+
+import anyio.to_thread
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles, который отдаёт небольшие файлы фронтенда из памяти.
+
+    Запись кэша сверяется с mtime/размером из `os.stat`, который StaticFiles и так
+    делает на каждый запрос, поэтому изменённый файл перечитывается сразу.
+    ETag/Last-Modified и ответы 304 остаются штатными.
+    """
+
+    max_cached_size = 1024 * 1024
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._cache: dict[str, tuple[int, int, bytes]] = {}
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = await super().get_response(path, scope)
+        if (
+            not isinstance(response, FileResponse)
+            or scope["method"] != "GET"
+            or response.stat_result is None
+            or response.stat_result.st_size > self.max_cached_size
+        ):
+            return response
+        # Диапазоны (Range) отдаёт штатный FileResponse: из памяти — только целый файл
+        if any(name == b"range" for name, _ in scope["headers"]):
+            return response
+
+        stat_result = response.stat_result
+        key = str(response.path)
+        cached = self._cache.get(key)
+        if cached is None or cached[0] != stat_result.st_mtime_ns or cached[1] != stat_result.st_size:
+            # Чтение с диска — в пуле потоков, чтобы не блокировать event loop
+            body = await anyio.to_thread.run_sync(_read_file, response.path)
+            cached = (stat_result.st_mtime_ns, stat_result.st_size, body)
+            self._cache[key] = cached
+
+        body = cached[2]
+        headers = {k: v for k, v in response.headers.items() if k != "accept-ranges"}
+        headers["content-length"] = str(len(body))
+        return Response(body, status_code=response.status_code, headers=headers)
+
+
+def _read_file(path: Union[str, os.PathLike[str]]) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
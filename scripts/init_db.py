@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import random
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Allow running as: python scripts/init_db.py
@@ -9,39 +10,64 @@ ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
-from backend.database import SessionLocal, engine
-from backend.models import Base, Criterion, Evaluation, EvaluationScore, Event, User
+from sqlalchemy import insert, select
+
+from backend.database import SessionLocal
+from backend.init_db import init_db
+from backend.models import Criterion, Evaluation, EvaluationScore, Event, User
 from backend.security import hash_password
-from backend.services import clamp_score
-
-
-def _get_or_create_user(db, *, nickname: str, full_name: str, group: str, password: str) -> User:
-    u = db.query(User).filter(User.nickname == nickname).first()
-    if u:
-        return u
-    u = User(
-        nickname=nickname,
-        full_name=full_name,
-        group=group,
-        password_hash=hash_password(password),
-        is_active=True,
-    )
-    db.add(u)
-    db.flush()
-    return u
 
 
-def _get_or_create_criterion(db, *, name: str, description: str, max_score: float, active: bool = True, event_id: int = None) -> Criterion:
-    q = db.query(Criterion).filter(Criterion.name == name)
-    if event_id:
-        q = q.filter(Criterion.event_id == event_id)
-    c = q.first()
-    if c:
-        return c
-    c = Criterion(name=name, description=description, max_score=float(max_score), active=bool(active), event_id=event_id)
-    db.add(c)
-    db.flush()
-    return c
+def _get_or_create_users(db, specs: list[dict]) -> list[User]:
+    """Пользователи по списку описаний (nickname, full_name, group, password) в том же порядке.
+
+    Существующие читаются одним запросом, недостающие добавляются с одним flush.
+    """
+    nicknames = [spec["nickname"] for spec in specs]
+    by_nick = {u.nickname: u for u in db.scalars(select(User).where(User.nickname.in_(nicknames)))}
+    missing = [spec for spec in specs if spec["nickname"] not in by_nick]
+    passwords = [spec["password"] for spec in missing]
+    if len(passwords) > 2:
+        # bcrypt отпускает GIL на время хэширования: потоки грузят все ядра без запуска процессов
+        with ThreadPoolExecutor() as pool:
+            hashes = list(pool.map(hash_password, passwords))
+    else:
+        hashes = [hash_password(p) for p in passwords]
+    for spec, password_hash in zip(missing, hashes):
+        u = User(
+            nickname=spec["nickname"],
+            full_name=spec["full_name"],
+            group=spec["group"],
+            password_hash=password_hash,
+            is_active=True,
+        )
+        db.add(u)
+        by_nick[u.nickname] = u
+    if missing:
+        db.flush()
+    return [by_nick[n] for n in nicknames]
+
+
+def _get_or_create_criteria(db, *, event_id: int, specs: list[dict]) -> list[Criterion]:
+    """Критерии события по списку описаний (name, description, max_score[, active]) в том же порядке."""
+    names = [spec["name"] for spec in specs]
+    by_name: dict[str, Criterion] = {}
+    for c in db.scalars(select(Criterion).where(Criterion.event_id == event_id, Criterion.name.in_(names)).order_by(Criterion.id)):
+        by_name.setdefault(c.name, c)
+    missing = [spec for spec in specs if spec["name"] not in by_name]
+    for spec in missing:
+        c = Criterion(
+            name=spec["name"],
+            description=spec["description"],
+            max_score=float(spec["max_score"]),
+            active=bool(spec.get("active", True)),
+            event_id=event_id,
+        )
+        db.add(c)
+        by_name[c.name] = c
+    if missing:
+        db.flush()
+    return [by_name[n] for n in names]
 
 
 def _get_or_create_event(db, *, name: str, description: str = "", is_active: bool = True) -> Event:
@@ -58,15 +84,16 @@ from backend.models import EventParticipant
 
 def _add_users_to_event(db, *, users: list[User], event: Event) -> None:
     """Добавляет пользователей как участников события."""
-    for user in users:
-        existing = db.query(EventParticipant).filter(
+    # Уже прикреплённые — одним запросом, недостающие — одним INSERT
+    existing = set(db.scalars(
+        select(EventParticipant.user_id).where(
             EventParticipant.event_id == event.id,
-            EventParticipant.user_id == user.id
-        ).first()
-        if not existing:
-            ep = EventParticipant(event_id=event.id, user_id=user.id)
-            db.add(ep)
-    db.flush()
+            EventParticipant.user_id.in_([u.id for u in users]),
+        )
+    ))
+    to_add = [{"event_id": event.id, "user_id": u.id} for u in users if u.id not in existing]
+    if to_add:
+        db.execute(insert(EventParticipant), to_add)
 
 
 def _seed_evaluations(db, *, users: list[User], criteria: list[Criterion], event_id: int = None) -> None:
@@ -84,53 +111,64 @@ def _seed_evaluations(db, *, users: list[User], criteria: list[Criterion], event
     if len(active_users) < 3 or not criteria:
         return
 
-    # For each target user create a few evaluations from others
+    # For each target user create a few evaluations from others.
+    # Оценки — одним INSERT ... RETURNING id (id в порядке строк), баллы — одним INSERT
+    evals: list[tuple[dict, list[tuple[int, float]]]] = []
     for target in active_users:
         raters = [u for u in active_users if u.id != target.id]
         rng.shuffle(raters)
         for rater in raters[: min(4, len(raters))]:
-            e = Evaluation(event_id=event_id, rater_id=rater.id, target_id=target.id, comment=f"Оценка от {rater.full_name}")
-            db.add(e)
-            db.flush()
-
+            e = {"event_id": event_id, "rater_id": rater.id, "target_id": target.id, "comment": f"Оценка от {rater.full_name}"}
+            scores = []
             for crit in criteria:
                 # Используем целые числа для оценок
                 max_s = int(crit.max_score)
                 min_score = max(1, int(max_s * 0.5))  # минимум 50% от макс
-                score = rng.randint(min_score, max_s)
-                db.add(EvaluationScore(evaluation_id=e.id, criterion_id=crit.id, score=float(score)))
+                scores.append((crit.id, float(rng.randint(min_score, max_s))))
+            evals.append((e, scores))
 
     # Add one intentionally anomalous score to demonstrate highlighting
     target = active_users[0]
     rater = active_users[1]
     crit = criteria[0]
-    e = Evaluation(event_id=event_id, rater_id=rater.id, target_id=target.id, comment="(seed) намеренно аномальная оценка")
-    db.add(e)
-    db.flush()
-    db.add(EvaluationScore(evaluation_id=e.id, criterion_id=crit.id, score=float(int(crit.max_score))))
+    e = {"event_id": event_id, "rater_id": rater.id, "target_id": target.id, "comment": "(seed) намеренно аномальная оценка"}
+    evals.append((e, [(crit.id, float(int(crit.max_score)))]))
+
+    eval_ids = db.scalars(
+        insert(Evaluation).returning(Evaluation.id, sort_by_parameter_order=True),
+        [e for e, _ in evals],
+    ).all()
+    db.execute(
+        insert(EvaluationScore),
+        [
+            {"evaluation_id": eval_id, "criterion_id": crit_id, "score": score}
+            for eval_id, (_, scores) in zip(eval_ids, evals)
+            for crit_id, score in scores
+        ],
+    )
 
 
 def main() -> None:
-    Base.metadata.create_all(bind=engine)
+    init_db()
 
     db = SessionLocal()
     try:
         # Users - расширенный список
-        users = [
-            _get_or_create_user(db, nickname="ivanov", full_name="Иванов Иван Иванович", group="ИС-31", password="password123"),
-            _get_or_create_user(db, nickname="petrova", full_name="Петрова Анна Сергеевна", group="ИС-31", password="password123"),
-            _get_or_create_user(db, nickname="sidorov", full_name="Сидоров Павел Олегович", group="ИС-31", password="password123"),
-            _get_or_create_user(db, nickname="smirnova", full_name="Смирнова Мария Ильинична", group="ИС-32", password="password123"),
-            _get_or_create_user(db, nickname="kuznetsov", full_name="Кузнецов Артём Денисович", group="ИС-32", password="password123"),
-            _get_or_create_user(db, nickname="volkova", full_name="Волкова Екатерина Павловна", group="ИС-32", password="password123"),
+        users = _get_or_create_users(db, [
+            dict(nickname="ivanov", full_name="Иванов Иван Иванович", group="ИС-31", password="password123"),
+            dict(nickname="petrova", full_name="Петрова Анна Сергеевна", group="ИС-31", password="password123"),
+            dict(nickname="sidorov", full_name="Сидоров Павел Олегович", group="ИС-31", password="password123"),
+            dict(nickname="smirnova", full_name="Смирнова Мария Ильинична", group="ИС-32", password="password123"),
+            dict(nickname="kuznetsov", full_name="Кузнецов Артём Денисович", group="ИС-32", password="password123"),
+            dict(nickname="volkova", full_name="Волкова Екатерина Павловна", group="ИС-32", password="password123"),
             # Дополнительные пользователи
-            _get_or_create_user(db, nickname="kozlov", full_name="Козлов Дмитрий Александрович", group="ИМ-31", password="password123"),
-            _get_or_create_user(db, nickname="morozova", full_name="Морозова Ольга Викторовна", group="ИМ-31", password="password123"),
-            _get_or_create_user(db, nickname="novikov", full_name="Новиков Алексей Игоревич", group="ИМ-32", password="password123"),
-            _get_or_create_user(db, nickname="fedorova", full_name="Фёдорова Елена Андреевна", group="ИМ-32", password="password123"),
-            _get_or_create_user(db, nickname="sokolov", full_name="Соколов Михаил Петрович", group="ПИ-31", password="password123"),
-            _get_or_create_user(db, nickname="lebedeva", full_name="Лебедева Наталья Сергеевна", group="ПИ-31", password="password123"),
-        ]
+            dict(nickname="kozlov", full_name="Козлов Дмитрий Александрович", group="ИМ-31", password="password123"),
+            dict(nickname="morozova", full_name="Морозова Ольга Викторовна", group="ИМ-31", password="password123"),
+            dict(nickname="novikov", full_name="Новиков Алексей Игоревич", group="ИМ-32", password="password123"),
+            dict(nickname="fedorova", full_name="Фёдорова Елена Андреевна", group="ИМ-32", password="password123"),
+            dict(nickname="sokolov", full_name="Соколов Михаил Петрович", group="ПИ-31", password="password123"),
+            dict(nickname="lebedeva", full_name="Лебедева Наталья Сергеевна", group="ПИ-31", password="password123"),
+        ])
 
         # Событие 1 - основное
         event1 = _get_or_create_event(db, name="Семестровая оценка 2024", description="Оценка работы студентов за осенний семестр 2024", is_active=True)
@@ -142,25 +180,25 @@ def main() -> None:
         event3 = _get_or_create_event(db, name="Хакатон 2023", description="Прошедший хакатон по разработке приложений", is_active=False)
 
         # Критерии для события 1
-        criteria1 = [
-            _get_or_create_criterion(db, name="Качество", description="Насколько качественно выполнена работа", max_score=10, event_id=event1.id),
-            _get_or_create_criterion(db, name="Сроки", description="Соблюдение сроков", max_score=10, event_id=event1.id),
-            _get_or_create_criterion(db, name="Коммуникация", description="Взаимодействие в команде", max_score=10, event_id=event1.id),
-        ]
+        criteria1 = _get_or_create_criteria(db, event_id=event1.id, specs=[
+            dict(name="Качество", description="Насколько качественно выполнена работа", max_score=10),
+            dict(name="Сроки", description="Соблюдение сроков", max_score=10),
+            dict(name="Коммуникация", description="Взаимодействие в команде", max_score=10),
+        ])
 
         # Критерии для события 2
-        criteria2 = [
-            _get_or_create_criterion(db, name="Техническая реализация", description="Качество кода и архитектуры", max_score=10, event_id=event2.id),
-            _get_or_create_criterion(db, name="Презентация", description="Качество защиты проекта", max_score=10, event_id=event2.id),
-            _get_or_create_criterion(db, name="Инновационность", description="Оригинальность решения", max_score=10, event_id=event2.id),
-            _get_or_create_criterion(db, name="Работа в команде", description="Вклад в командную работу", max_score=10, event_id=event2.id),
-        ]
+        criteria2 = _get_or_create_criteria(db, event_id=event2.id, specs=[
+            dict(name="Техническая реализация", description="Качество кода и архитектуры", max_score=10),
+            dict(name="Презентация", description="Качество защиты проекта", max_score=10),
+            dict(name="Инновационность", description="Оригинальность решения", max_score=10),
+            dict(name="Работа в команде", description="Вклад в командную работу", max_score=10),
+        ])
 
         # Критерии для события 3 (хакатон)
-        criteria3 = [
-            _get_or_create_criterion(db, name="Креативность", description="Оригинальность идеи", max_score=10, event_id=event3.id),
-            _get_or_create_criterion(db, name="Реализация", description="Техническая реализация за ограниченное время", max_score=10, event_id=event3.id),
-        ]
+        criteria3 = _get_or_create_criteria(db, event_id=event3.id, specs=[
+            dict(name="Креативность", description="Оригинальность идеи", max_score=10),
+            dict(name="Реализация", description="Техническая реализация за ограниченное время", max_score=10),
+        ])
 
         # Добавляем пользователей как участников событий
         _add_users_to_event(db, users=users[:6], event=event1)  # Первые 6 в событие 1